@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 from pathlib import Path
 
+from LittleLemonAPI.database import database_config
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -45,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so its timings cover the whole stack
+    'LittleLemonAPI.metrics.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,12 +82,10 @@ WSGI_APPLICATION = 'LittleLemon.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+# configured from DATABASE_URL and friends, see LittleLemonAPI/database.py
+DATABASES = database_config(BASE_DIR)
+
+DATABASE_ROUTERS = ['LittleLemonAPI.database.ReplicaRouter']
 
 
 # Password validation
@@ -129,11 +131,16 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES' : [
-        'rest_framework.renderers.JSONRenderer',
+        'LittleLemonAPI.renderers.FastJSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ],
+    'DEFAULT_PARSER_CLASSES' : [
+        'LittleLemonAPI.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_AUTHENTICATION_CLASSES' : (
-        'rest_framework.authentication.TokenAuthentication',
+        'LittleLemonAPI.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),  
     'DEFAULT_FILTER_BACKENDS' : [
@@ -144,9 +151,10 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE' : 4,
     'DEFAULT_THROTTLE_CLASSES' : [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle',  
+        'LittleLemonAPI.throttling.AnonThrottle',
+        'LittleLemonAPI.throttling.UserThrottle',  
     ],
+    # '<throttle_scope>.user' / '<throttle_scope>.anon' override these per endpoint, e.g. 'checkout.user': '30/hour'
     'DEFAULT_THROTTLE_RATES': {
         'anon': '100/hour',
         'user': '200/hour',
@@ -155,4 +163,13 @@ REST_FRAMEWORK = {
 
 DJOSER = {
     "USER_ID_FIELD" : "username",
-}
\ No newline at end of file
+}
+
+# LittleLemonAPI tuning, see LittleLemonAPI/conf.py for every key and its default
+LITTLELEMON = {
+    'ROLE_CACHE_TTL': 60,
+    # set to a CACHES alias to share resolved roles between workers
+    'ROLE_SHARED_CACHE': None,
+    # same for authenticated tokens
+    'TOKEN_SHARED_CACHE': None,
+}
@@ -0,0 +1,30 @@
+"""
+Production settings for LittleLemon project.
+
+Extends settings.py, select it with DJANGO_SETTINGS_MODULE=LittleLemon.settings_production
+"""
+
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import REST_FRAMEWORK, SECRET_KEY, LITTLELEMON
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', SECRET_KEY)
+
+DEBUG = False
+
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host]
+
+# JSON only, skipping the browsable API keeps content negotiation to a single renderer
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES' : [
+        'LittleLemonAPI.renderers.FastJSONRenderer',
+    ],
+}
+
+# throttle counters shared by all workers of the host unless a shared cache is configured
+LITTLELEMON = {
+    **LITTLELEMON,
+    'THROTTLE_STORE': os.environ.get('THROTTLE_STORE', 'sqlite'),
+}
@@ -1,8 +1,18 @@
 from django.contrib import admin
 from . import models
 
+# the __str__ of these models reads related rows, select them with the changelist page
+class CartAdmin(admin.ModelAdmin):
+    list_select_related = ('user', 'menuitem')
+
+class OrderAdmin(admin.ModelAdmin):
+    list_select_related = ('user',)
+
+class OrderItemAdmin(admin.ModelAdmin):
+    list_select_related = ('menuitem',)
+
 admin.site.register(models.MenuItem)
 admin.site.register(models.Category)
-admin.site.register(models.Cart)
-admin.site.register(models.Order)
-admin.site.register(models.OrderItem)
\ No newline at end of file
+admin.site.register(models.Cart, CartAdmin)
+admin.site.register(models.Order, OrderAdmin)
+admin.site.register(models.OrderItem, OrderItemAdmin)
\ No newline at end of file
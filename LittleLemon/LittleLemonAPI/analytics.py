@@ -0,0 +1,197 @@
+"""
+Daily sales rollups.
+
+The rollup tables always describe exactly the orders counted_orders()
+returns, archived orders included (archive.py only moves counted orders): those
+with an id up to the 'sales' RollupWatermark but for the RollupGaps. New orders
+are folded in incrementally by catch_up, which adds the aggregates of the
+orders past the watermark to the existing rows and moves the watermark. Ids
+it skips are kept as gaps: on PostgreSQL an order with a lower id may commit
+after a higher one, and is counted by the next catch_up once it is there. Days whose orders changed after being
+counted (status or delivery crew updates, deletes) are recomputed by
+refresh_days. Both run under a lock on the watermark row, so concurrent
+workers never count an order twice.
+"""
+import contextvars
+import datetime
+import decimal
+from contextlib import contextmanager
+from django.db import transaction
+from django.db.models import Count, Sum, Q
+from django.db.models.signals import post_save, post_delete
+from django.utils import timezone
+from django.dispatch import receiver
+from . import jobs, models
+from .conf import app_setting
+
+WATERMARK = 'sales'
+
+ROLLUPS = [
+    # model, key field, summed fields
+    (models.DailySales, None, ['order_count', 'items_sold', 'revenue']),
+    (models.DailyMenuItemSales, 'menuitem_id', ['quantity', 'revenue']),
+    (models.DailyCategorySales, 'category_id', ['quantity', 'revenue']),
+    (models.DailyDeliveryCrewOrders, 'delivery_crew_id', ['order_count', 'delivered_count']),
+]
+
+def lock_watermark():
+    # locks the watermark row until the transaction ends, no rollup runs meanwhile
+    watermark, _ = models.RollupWatermark.objects.select_for_update().get_or_create(name=WATERMARK)
+    return watermark
+
+_archiving = contextvars.ContextVar('archiving', default=False)
+
+@contextmanager
+def archiving():
+    # orders deleted in this block move to the archive and stay counted, their days are not recomputed
+    token = _archiving.set(True)
+    try:
+        yield
+    finally:
+        _archiving.reset(token)
+
+def _add(rollup, key, **values):
+    row = rollup.setdefault(key, dict.fromkeys(values, 0))
+    for name, value in values.items():
+        row[name] += value or 0
+
+def aggregate(orders):
+    """
+    {model: {(date, key): {field: value}}} of the given Order queryset,
+    four grouped queries whatever the number of orders.
+    """
+    rollups = {model: {} for model, _, _ in ROLLUPS}
+    for row in orders.values('date').annotate(order_count=Count('id'), revenue=Sum('total')).order_by():
+        _add(rollups[models.DailySales], (row['date'], None), order_count=row['order_count'], items_sold=0, revenue=row['revenue'])
+
+    # OrderItem, or ArchivedOrderItem for archived orders
+    item_model = orders.model._meta.get_field('order_items').related_model
+    items = item_model.objects.filter(order__in=orders).values('order__date', 'menuitem_id', 'menuitem__category_id')
+    for row in items.annotate(quantity=Sum('quantity'), revenue=Sum('price')).order_by():
+        date = row['order__date']
+        _add(rollups[models.DailyMenuItemSales], (date, row['menuitem_id']), quantity=row['quantity'], revenue=row['revenue'])
+        _add(rollups[models.DailyCategorySales], (date, row['menuitem__category_id']), quantity=row['quantity'], revenue=row['revenue'])
+        _add(rollups[models.DailySales], (date, None), order_count=0, items_sold=row['quantity'], revenue=0)
+
+    crews = orders.filter(delivery_crew__isnull=False).values('date', 'delivery_crew_id')
+    for row in crews.annotate(order_count=Count('id'), delivered_count=Count('id', filter=Q(status=models.OrderStatus.DELIVERED))).order_by():
+        _add(rollups[models.DailyDeliveryCrewOrders], (row['date'], row['delivery_crew_id']), order_count=row['order_count'], delivered_count=row['delivered_count'])
+    return rollups
+
+def _combine(rollups, other):
+    for model, rows in other.items():
+        for key, values in rows.items():
+            _add(rollups[model], key, **values)
+    return rollups
+
+def _write(rollups, increment):
+    for model, key_field, fields in ROLLUPS:
+        rows = rollups[model]
+        if not rows:
+            continue
+        if increment:
+            # add to what is already there, one read per table for every key touched
+            existing = model.objects.filter(date__in={date for date, _ in rows})
+            for row in existing.values('date', *([key_field] if key_field else []), *fields):
+                key = (row['date'], row[key_field] if key_field else None)
+                if key in rows:
+                    _add(rows, key, **{field: row[field] for field in fields})
+        objects = [
+            model(date=date, **({key_field: key} if key_field else {}), **values)
+            for (date, key), values in rows.items()
+        ]
+        unique_fields = ['date', key_field[:-3]] if key_field else ['date']
+        model.objects.bulk_create(objects, update_conflicts=True, unique_fields=unique_fields, update_fields=fields)
+
+def counted_orders(watermark):
+    # the hot orders behind the watermark, which the rollups count
+    return models.Order.objects.filter(id__lte=watermark.order_id).exclude(id__in=models.RollupGap.objects.values('order_id'))
+
+@jobs.task(unique=True)
+def catch_up(batch_size=None):
+    """
+    Fold the orders created since the last run into the rollups, batch_size orders
+    per transaction, with the orders of gaps that committed meanwhile. Returns the
+    number of orders counted.
+    """
+    batch_size = batch_size or app_setting('ROLLUP_BATCH_SIZE')
+    counted = 0
+    while True:
+        with transaction.atomic():
+            watermark = lock_watermark()
+            gaps = models.RollupGap.objects.values('order_id')
+            late = list(models.Order.objects.filter(id__in=gaps).values_list('id', flat=True)[:batch_size])
+            ids = list(models.Order.objects.filter(id__gt=watermark.order_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids and not late:
+                expired = timezone.now() - datetime.timedelta(seconds=app_setting('ROLLUP_GAP_TIMEOUT'))
+                models.RollupGap.objects.filter(created__lt=expired).delete()
+                return counted
+            orders = Q(id__in=late)
+            if ids:
+                orders |= Q(id__gt=watermark.order_id, id__lte=ids[-1])
+            _write(aggregate(models.Order.objects.filter(orders)), increment=True)
+            models.RollupGap.objects.filter(order_id__in=late).delete()
+            if ids:
+                # rolled back, deleted or still uncommitted; a later catch_up counts the ones that show up
+                skipped = set(range(watermark.order_id + 1, ids[-1])).difference(ids).difference(
+                    models.ArchivedOrder.objects.filter(id__gt=watermark.order_id, id__lt=ids[-1]).values_list('id', flat=True)
+                )
+                models.RollupGap.objects.bulk_create([models.RollupGap(order_id=id) for id in sorted(skipped)], ignore_conflicts=True)
+                watermark.order_id = ids[-1]
+                watermark.save(update_fields=['order_id'])
+        counted += len(late) + len(ids)
+
+@jobs.task(unique=True)
+def refresh_days(dates):
+    # recompute the given days (dates or ISO strings) from the orders already counted
+    with transaction.atomic():
+        watermark = lock_watermark()
+        for model, _, _ in ROLLUPS:
+            model.objects.filter(date__in=dates).delete()
+        rollups = aggregate(counted_orders(watermark).filter(date__in=dates))
+        _write(_combine(rollups, aggregate(models.ArchivedOrder.objects.filter(date__in=dates))), increment=False)
+
+def rebuild(batch_size=None):
+    with transaction.atomic():
+        watermark = lock_watermark()
+        for model, _, _ in ROLLUPS:
+            model.objects.all().delete()
+        models.RollupGap.objects.all().delete()
+        watermark.order_id = 0
+        watermark.save(update_fields=['order_id'])
+        # archived orders are counted at once, the hot ones by catch_up from the start
+        _write(aggregate(models.ArchivedOrder.objects.all()), increment=False)
+        archived = models.ArchivedOrder.objects.count()
+    return archived + catch_up(batch_size)
+
+def _day(order):
+    # job arguments are JSON, a new order's date is still the datetime of its default
+    return models.Order._meta.get_field('date').to_python(order.date).isoformat()
+
+@receiver(post_save, sender=models.Order)
+def _order_saved(sender, instance, created, **kwargs):
+    if not app_setting('ROLLUP_ON_WRITE'):
+        return
+    # queued after commit, the order lines of a checkout are only written after the order itself;
+    # a failed rollup is retried by the job queue instead of failing the request
+    if created:
+        catch_up.enqueue()
+    else:
+        refresh_days.enqueue([_day(instance)])
+
+@receiver(post_delete, sender=models.Order)
+def _order_deleted(sender, instance, **kwargs):
+    if app_setting('ROLLUP_ON_WRITE') and not _archiving.get():
+        refresh_days.enqueue([_day(instance)])
+
+def _zero(field):
+    return decimal.Decimal(0) if field == 'revenue' else 0
+
+def totals(rows, fields):
+    # sums of the given rollup rows, decimals stay decimals
+    return {field: sum((row[field] for row in rows), _zero(field)) for field in fields}
+
+def queryset_totals(queryset, fields):
+    # the same sums computed by the database, for rows that are not all fetched
+    sums = queryset.aggregate(**{field: Sum(field) for field in fields})
+    return {field: _zero(field) if sums[field] is None else sums[field] for field in fields}
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class LittlelemonapiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'LittleLemonAPI'
+
+    def ready(self):
+        # registers the signal receivers that keep the role, token and menu caches, the sales rollups
+        # and the menu search index fresh
+        from . import roles, catalogue, authentication, analytics, search  # noqa: F401
+        from .database import apply_sqlite_pragmas
+        from .metrics import install_wrapper
+        connection_created.connect(apply_sqlite_pragmas)
+        connection_created.connect(install_wrapper)
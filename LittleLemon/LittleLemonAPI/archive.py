@@ -0,0 +1,107 @@
+"""
+Order archival.
+
+archive_orders moves delivered orders older than ARCHIVE_AFTER_DAYS, with
+their lines, from Order / OrderItem to ArchivedOrder / ArchivedOrderItem,
+keeping their ids, so the hot tables and their indexes only hold recent and
+open orders. It works in batches of ARCHIVE_BATCH_SIZE orders, one
+transaction each, under the sales rollups' watermark lock: only orders the
+rollups have already counted are moved, and analytics reads both tables when
+it recomputes a day.
+
+Everything but the managers' order listing and the export reads the hot
+tables only; those two read the union when the requested range reaches into
+the archive (reaches_archive).
+"""
+import datetime
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from . import analytics, models
+from .conf import app_setting
+from .filters import OrderFilter
+
+ORDER_COLUMNS = ['id', 'user_id', 'delivery_crew_id', 'status', 'total', 'date']
+ITEM_COLUMNS = ['id', 'order_id', 'menuitem_id', 'quantity', 'unit_price', 'price']
+
+def horizon(days=None):
+    # orders dated before this day are old enough to be archived
+    return timezone.localdate() - datetime.timedelta(days=app_setting('ARCHIVE_AFTER_DAYS') if days is None else days)
+
+def archive_orders(before, batch_size=None):
+    """
+    Move the delivered orders dated before `before` and counted by the rollups to
+    the archive, batch_size orders per transaction. Returns the number of orders moved.
+    """
+    batch_size = batch_size or app_setting('ARCHIVE_BATCH_SIZE')
+    moved = 0
+    while True:
+        with transaction.atomic():
+            watermark = analytics.lock_watermark()
+            orders = list(
+                analytics.counted_orders(watermark).select_for_update()
+                .filter(status=models.OrderStatus.DELIVERED, date__lt=before)
+                .order_by('date').values(*ORDER_COLUMNS)[:batch_size]
+            )
+            if not orders:
+                return moved
+            ids = [order['id'] for order in orders]
+            items = models.OrderItem.objects.filter(order_id__in=ids).values(*ITEM_COLUMNS)
+            models.ArchivedOrder.objects.bulk_create([models.ArchivedOrder(**order) for order in orders])
+            models.ArchivedOrderItem.objects.bulk_create([models.ArchivedOrderItem(**item) for item in items])
+            # the lines go with their orders; the rollups must not recount days these orders still belong to
+            with analytics.archiving():
+                models.Order.objects.filter(id__in=ids).delete()
+        moved += len(orders)
+
+def reaches_archive(query_params):
+    """
+    Whether orders matching the ?status= and date filters may be archived: the
+    status allows delivered orders and the range starts on or before the newest
+    archived day. A range without a start (no date or date__gte) lists the hot
+    orders only. Invalid filters answer False, the hot queryset reports them.
+    """
+    filterset = OrderFilter(query_params, queryset=models.Order.objects.none())
+    if not filterset.is_valid():
+        return False
+    data = filterset.form.cleaned_data
+    if data.get('status') not in (None, '', models.OrderStatus.DELIVERED.label):
+        return False
+    start = data.get('date') or data.get('date__gte')
+    if start is None:
+        return False
+    newest = models.ArchivedOrder.objects.aggregate(newest=Max('date'))['newest']
+    return newest is not None and start <= newest
+
+class OrderHistory:
+    """
+    Hot and archived rows read as one UNION ALL, queryset enough for the paginators:
+    filter() narrows every branch (cursor positions), order_by() and slicing apply
+    to the union and count() adds up the counts of the branches.
+    """
+    def __init__(self, branches, ordering):
+        self.branches = branches
+        self.ordering = tuple(ordering)
+
+    @property
+    def ordered(self):
+        return bool(self.ordering)
+
+    def filter(self, *args, **kwargs):
+        return OrderHistory([branch.filter(*args, **kwargs) for branch in self.branches], self.ordering)
+
+    def order_by(self, *ordering):
+        return OrderHistory(self.branches, ordering)
+
+    def count(self):
+        return sum(branch.count() for branch in self.branches)
+
+    def union(self):
+        first, *rest = [branch.order_by() for branch in self.branches]
+        return first.union(*rest, all=True).order_by(*self.ordering)
+
+    def __getitem__(self, index):
+        return self.union()[index]
+
+    def __iter__(self):
+        return iter(self.union())
@@ -0,0 +1,152 @@
+"""
+ASGI-native variants of the read heavy list endpoints.
+
+They reuse the querysets, filters, permissions, throttles and
+ValuesRepresentation of the DRF views in views.py but authenticate, query and
+paginate through Django's async ORM, so under an ASGI server a request waiting
+on the database does not hold a worker thread. The checks that may touch the
+database or the throttle store run through sync_to_async, and so do the pages
+the async ORM can not serve (cursor pagination, the order history union), with
+the view's own paginator. Responses are JSON only.
+"""
+from asgiref.sync import sync_to_async
+from django.db.models import QuerySet
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+from . import catalogue
+from . import views
+from .authentication import aauthenticate_credentials
+from .conf import app_setting
+from .renderers import FastJSONRenderer
+from .roles import aget_roles
+
+async def authenticate(request):
+    """
+    Async counterpart of CachedTokenAuthentication followed by SessionAuthentication,
+    returns the user or None when no credentials were sent.
+    """
+    header = request.headers.get('Authorization', '').split()
+    if header and header[0].lower() == 'token':
+        if len(header) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header. Token string should not contain spaces.')
+        return (await aauthenticate_credentials(header[1]))[0]
+
+    user = await request.auser()
+    return user if user.is_authenticated else None
+
+class AsyncListView(View):
+    http_method_names = ['get']
+    # the DRF view whose queryset, filters, throttles and list representation are served
+    view_class = None
+    page_size = api_settings.PAGE_SIZE
+    renderer = FastJSONRenderer()
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            user = await authenticate(request)
+            if user is None:
+                raise exceptions.NotAuthenticated()
+            await aget_roles(user)
+            view = self.get_view(request, user, *args, **kwargs)
+            await sync_to_async(view.check_permissions)(view.request)
+            await sync_to_async(view.check_throttles)(view.request)
+            return await self.list(view)
+        except exceptions.APIException as exc:
+            return self.handle_exception(exc)
+
+    def get_view(self, request, user, *args, **kwargs):
+        # no authenticators, the user is already resolved and DRF's sync authentication must not run here
+        drf_request = Request(request, authenticators=())
+        drf_request.user = user
+        view = self.view_class(request=drf_request, args=args, kwargs=kwargs, format_kwarg=None)
+        view.headers = {}
+        return view
+
+    async def list(self, view):
+        return self.render(await self.paginate(view))
+
+    async def paginate(self, view):
+        queryset = await sync_to_async(view.list_rows)()
+        # read after list_rows, which may switch it
+        representation = view.list_representation
+        request = view.request
+        keyset_requested = getattr(view.paginator, 'keyset_requested', None)
+        if not isinstance(queryset, QuerySet) or (keyset_requested and keyset_requested(request)):
+            return await sync_to_async(self.paginate_sync)(view, queryset)
+
+        page_number = request.query_params.get('page', 1)
+        count = await queryset.acount()
+        last_page = max(1, -(-count // self.page_size))
+        try:
+            page_number = last_page if page_number == 'last' else int(page_number)
+        except (TypeError, ValueError):
+            raise exceptions.NotFound('Invalid page.')
+        if page_number < 1 or page_number > last_page:
+            raise exceptions.NotFound('Invalid page.')
+
+        offset = (page_number - 1) * self.page_size
+        rows = [row async for row in queryset[offset:offset + self.page_size]]
+
+        url = request.build_absolute_uri()
+        previous = None
+        if page_number > 1:
+            previous = remove_query_param(url, 'page') if page_number == 2 else replace_query_param(url, 'page', page_number - 1)
+        return {
+            'count': count,
+            'next': replace_query_param(url, 'page', page_number + 1) if page_number < last_page else None,
+            'previous': previous,
+            'results': await representation.ato_representation(rows),
+        }
+
+    @staticmethod
+    def paginate_sync(view, queryset):
+        page = view.paginate_queryset(queryset)
+        if page is None:
+            return view.list_representation.to_representation(queryset)
+        return view.get_paginated_response(view.list_representation.to_representation(page)).data
+
+    def render(self, data, status=200, headers=None):
+        content = self.renderer.render(data) if data is not None else b''
+        response = HttpResponse(content, status=status, content_type='application/json')
+        for name, value in (headers or {}).items():
+            response[name] = value
+        return response
+
+    def handle_exception(self, exc):
+        headers = {}
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            headers['WWW-Authenticate'] = 'Token'
+        if getattr(exc, 'wait', None):
+            headers['Retry-After'] = '%d' % exc.wait
+        data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+        return self.render(data, exc.status_code, headers)
+
+class AsyncCatalogueListView(AsyncListView):
+    # same version keyed page cache and 304 handling as CatalogueCacheMixin
+    async def list(self, view):
+        key, headers = catalogue.page_key(view.request, await catalogue.amenu_version())
+        if catalogue.not_modified(view.request, headers):
+            return self.render(None, 304, headers)
+
+        cache = catalogue.catalogue_cache()
+        data = await cache.aget(key)
+        if data is None:
+            data = await self.paginate(view)
+            await cache.aset(key, data, app_setting('CATALOGUE_CACHE_TTL'))
+        return self.render(data, headers=headers)
+
+class AsyncMenuItemsView(AsyncCatalogueListView):
+    view_class = views.MenuItemsView
+
+class AsyncCategoryItemsView(AsyncCatalogueListView):
+    view_class = views.CategoryItemsView
+
+class AsyncCartItemsView(AsyncListView):
+    view_class = views.CartItemsView
+
+class AsyncOrdersView(AsyncListView):
+    view_class = views.OrdersView
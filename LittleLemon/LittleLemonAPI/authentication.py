@@ -0,0 +1,131 @@
+import functools
+import hashlib
+from django.contrib.auth.models import User
+from django.db import router
+from django.core.cache import caches
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from .caching import LRUCache
+from .conf import app_setting
+from .roles import get_roles, aget_roles
+
+_local_cache = LRUCache(app_setting('TOKEN_CACHE_SIZE'), app_setting('TOKEN_CACHE_TTL'))
+
+def _shared_cache():
+    alias = app_setting('TOKEN_SHARED_CACHE')
+    return caches[alias] if alias else None
+
+def _digest(key):
+    # raw tokens never end up in a cache key
+    return hashlib.sha256(key.encode()).hexdigest()
+
+def _cache_key(digest):
+    return 'littlelemon:token:%s' % digest
+
+def _check(entry):
+    if not entry[CACHED_FIELDS.index('is_active')]:
+        raise exceptions.AuthenticationFailed('User inactive or deleted.')
+
+# what the caches keep of a user: enough for authentication and the permissions, never the password hash
+CACHED_FIELDS = ('id', 'username', 'is_active', 'is_staff', 'is_superuser')
+
+# a save touching one of these drops the user's cached tokens
+EVICTING_FIELDS = {'password', 'username', 'is_active', 'is_staff', 'is_superuser'}
+
+def _entry(user):
+    return tuple(getattr(user, field) for field in CACHED_FIELDS)
+
+def _remember(digest, entry):
+    shared = _shared_cache()
+    if shared is not None:
+        shared.set(_cache_key(digest), entry, app_setting('TOKEN_SHARED_CACHE_TTL'))
+    else:
+        _local_cache.set(digest, entry)
+
+def _cached(digest):
+    # with a shared tier only that one is read, an eviction by any worker then applies to all of them at once
+    shared = _shared_cache()
+    if shared is not None:
+        return shared.get(_cache_key(digest))
+    return _local_cache.get(digest)
+
+def _load_deferred(user, using=None, fields=None, **kwargs):
+    # reading one deferred field loads them all, in one query
+    deferred = user.get_deferred_fields()
+    if fields is not None and deferred.issuperset(fields):
+        fields = deferred
+    User.refresh_from_db(user, using=using, fields=fields, **kwargs)
+
+def _authenticated(key, entry):
+    # every request gets its own user, the per request role memo never reaches the cache. Its other
+    # fields are deferred: loaded from the primary on first access, and a save() before that only
+    # writes the fields that were set, never blanks over the rest
+    values = dict(zip(CACHED_FIELDS, entry))
+    names = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    user = User.from_db(router.db_for_write(User), names, [values[name] for name in names])
+    user.refresh_from_db = functools.partial(_load_deferred, user)
+    return user, Token(key=key, user=user)
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that keeps token -> user in a process-local LRU with TTL,
+    or in a shared django cache when one is configured, and resolves the user's roles
+    while the database is being hit anyway. A warm request authenticates
+    and passes the role based permissions without a query.
+    Entries are dropped when the token is deleted (djoser's token logout)
+    and whenever a user save changes the password, the username or the flags,
+    deactivation included. Without a shared cache the other workers only learn
+    about it when their entries' TTL runs out; with one, every worker reads
+    the shared tier only.
+    """
+    def authenticate_credentials(self, key):
+        digest = _digest(key)
+        entry = _cached(digest)
+        if entry is None:
+            user = super().authenticate_credentials(key)[0]
+            get_roles(user)
+            entry = _entry(user)
+            _remember(digest, entry)
+        _check(entry)
+        return _authenticated(key, entry)
+
+async def aauthenticate_credentials(key):
+    # the same lookups as CachedTokenAuthentication for the async views
+    digest = _digest(key)
+    shared = _shared_cache()
+    entry = await shared.aget(_cache_key(digest)) if shared is not None else _local_cache.get(digest)
+    if entry is None:
+        try:
+            user = (await Token.objects.select_related('user').aget(key=key)).user
+        except Token.DoesNotExist:
+            raise exceptions.AuthenticationFailed('Invalid token.')
+        await aget_roles(user)
+        entry = _entry(user)
+        if shared is not None:
+            await shared.aset(_cache_key(digest), entry, app_setting('TOKEN_SHARED_CACHE_TTL'))
+        else:
+            _local_cache.set(digest, entry)
+    _check(entry)
+    return _authenticated(key, entry)
+
+def evict_token(key):
+    digest = _digest(key)
+    _local_cache.delete(digest)
+    shared = _shared_cache()
+    if shared is not None:
+        shared.delete(_cache_key(digest))
+
+@receiver(post_delete, sender=Token)
+def _token_deleted(sender, instance, **kwargs):
+    evict_token(instance.key)
+
+@receiver(post_save, sender=User)
+def _user_saved(sender, instance, created, update_fields, **kwargs):
+    # saves of other fields only, last_login updates for instance, cost no token query
+    if created or (update_fields is not None and not EVICTING_FIELDS.intersection(update_fields)):
+        return
+    for key in Token.objects.filter(user=instance).values_list('key', flat=True):
+        evict_token(key)
@@ -0,0 +1,82 @@
+from collections import namedtuple
+from django.db import connection, transaction
+from django.db.models import F, Value, DecimalField
+from django.db.models.functions import Round
+from . import models
+from .conf import app_setting
+
+CartResult = namedtuple('CartResult', ['added', 'missing'])
+
+class CartLimitExceeded(Exception):
+    # lines that would go past CART_MAX_QUANTITY, nothing of the request was written
+    def __init__(self, menuitem_ids):
+        super().__init__(menuitem_ids)
+        self.menuitem_ids = menuitem_ids
+
+def _merge(items):
+    # one row per menu item, a row can not be updated twice by the same upsert
+    quantities = {}
+    for menuitem_id, quantity in items:
+        quantities[menuitem_id] = quantities.get(menuitem_id, 0) + quantity
+    return quantities
+
+def add_items(user, items):
+    """
+    Add (menuitem_id, quantity) pairs to the user's cart with a single
+    INSERT ... SELECT ... ON CONFLICT DO UPDATE statement: new lines are created,
+    lines already in the cart get their quantity increased, and unit_price/price
+    are taken from the menu and computed by the database.
+    Returns a CartResult with the menu item ids added and the ones not on the menu,
+    raises CartLimitExceeded when a line would end up above CART_MAX_QUANTITY.
+    """
+    quantities = _merge(items)
+    if not quantities:
+        return CartResult([], [])
+    limit = app_setting('CART_MAX_QUANTITY')
+    # the upsert only bounds lines already in the cart, merged repeats of a new one are checked here
+    over = [id for id, quantity in quantities.items() if quantity > limit]
+    if over:
+        # ids not on the menu are left to the statement, which reports them missing
+        on_menu = set(models.MenuItem.objects.filter(id__in=over).values_list('id', flat=True))
+        if on_menu:
+            raise CartLimitExceeded([id for id in over if id in on_menu])
+
+    qn = connection.ops.quote_name
+    cart, menuitem = qn(models.Cart._meta.db_table), qn(models.MenuItem._meta.db_table)
+    # the casts type the parameters for PostgreSQL, the WHERE is required by SQLite's upsert parser
+    sql = (
+        'WITH lines (menuitem_id, quantity) AS (VALUES %(values)s) '
+        'INSERT INTO %(cart)s (user_id, menuitem_id, quantity, unit_price, price) '
+        'SELECT CAST(%%s AS integer), menuitem.id, lines.quantity, menuitem.price, ROUND(menuitem.price * lines.quantity, 2) '
+        'FROM lines JOIN %(menuitem)s menuitem ON menuitem.id = lines.menuitem_id WHERE true '
+        'ON CONFLICT (menuitem_id, user_id) DO UPDATE SET '
+        'quantity = %(cart)s.quantity + excluded.quantity, '
+        'unit_price = excluded.unit_price, '
+        'price = ROUND(excluded.unit_price * (%(cart)s.quantity + excluded.quantity), 2) '
+        # lines past the limit are left alone and so missing from RETURNING
+        'WHERE %(cart)s.quantity + excluded.quantity <= CAST(%%s AS integer) '
+        'RETURNING menuitem_id'
+    ) % {
+        'values': ', '.join(['(CAST(%s AS integer), CAST(%s AS integer))'] * len(quantities)),
+        'cart': cart,
+        'menuitem': menuitem,
+    }
+    params = [value for line in quantities.items() for value in line] + [user.pk, limit]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        added = {row[0] for row in cursor.fetchall()}
+        rest = [id for id in quantities if id not in added]
+        if rest:
+            # told apart only when something was not added: on the menu means over the limit
+            on_menu = set(models.MenuItem.objects.filter(id__in=rest).values_list('id', flat=True))
+            if on_menu:
+                raise CartLimitExceeded([id for id in rest if id in on_menu])
+    return CartResult([id for id in quantities if id in added], rest)
+
+def set_quantity(user, menuitem_id, quantity):
+    # one UPDATE, the line price is recomputed from its unit price; False when the line is not in the cart
+    price = Round(F('unit_price') * Value(quantity), 2, output_field=DecimalField(max_digits=6, decimal_places=2))
+    return models.Cart.objects.filter(user=user, menuitem_id=menuitem_id).update(quantity=quantity, price=price) > 0
+
+def remove_item(user, menuitem_id):
+    return models.Cart.objects.filter(user=user, menuitem_id=menuitem_id).delete()[0] > 0
@@ -0,0 +1,107 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+from . import models
+from .conf import app_setting
+
+VERSION_KEY = 'littlelemon:menu:version'
+
+def catalogue_cache():
+    return caches[app_setting('CATALOGUE_CACHE')]
+
+def _version_timeout(cache):
+    # a process-local cache never sees the bumps made by other workers, its version expires
+    # after CATALOGUE_VERSION_TTL seconds so they serve a stale menu that long at most
+    return app_setting('CATALOGUE_VERSION_TTL') if isinstance(cache, LocMemCache) else None
+
+def menu_version():
+    """
+    Current version of the menu (items and categories).
+    Versions are millisecond timestamps, so a version lost from the cache is
+    replaced by a newer one instead of resurrecting old cached pages.
+    """
+    cache = catalogue_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, int(time.time() * 1000), _version_timeout(cache))
+        version = cache.get(VERSION_KEY)
+    return version
+
+async def amenu_version():
+    cache = catalogue_cache()
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, int(time.time() * 1000), _version_timeout(cache))
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+def bump_menu_version():
+    cache = catalogue_cache()
+    current = cache.get(VERSION_KEY) or 0
+    cache.set(VERSION_KEY, max(int(time.time() * 1000), current + 1), _version_timeout(cache))
+
+@receiver(post_save, sender=models.MenuItem)
+@receiver(post_delete, sender=models.MenuItem)
+@receiver(post_save, sender=models.Category)
+@receiver(post_delete, sender=models.Category)
+def _menu_changed(sender, **kwargs):
+    # bumping after commit keeps readers from caching rows of a transaction that may still roll back
+    transaction.on_commit(bump_menu_version)
+
+def _etag(version, key):
+    return '"%s"' % hashlib.sha1(('%s:%s' % (version, key)).encode()).hexdigest()
+
+def page_key(request, version):
+    """
+    Cache key and validator headers of a menu page, one per version and per full url
+    so every category/search/ordering/page combination gets its own entry.
+    """
+    url = request.build_absolute_uri(request.path) + '?' + urlencode(sorted(request.GET.lists()), doseq=True)
+    key = 'littlelemon:menu:%s:%s' % (version, hashlib.sha1(url.encode()).hexdigest())
+    headers = {
+        'ETag': _etag(version, key),
+        'Last-Modified': http_date(version / 1000),
+        'Cache-Control': 'private, no-cache',
+    }
+    return key, headers
+
+def not_modified(request, headers):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or headers['ETag'] in tags or 'W/' + headers['ETag'] in tags
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return if_modified_since is not None and parse_http_date_safe(headers['Last-Modified']) <= if_modified_since
+
+class CatalogueCacheMixin:
+    """
+    Caches the serialized list response of menu views, see page_key.
+    Clients revalidating with If-None-Match or If-Modified-Since get a 304
+    without the queryset or serializer being touched.
+    """
+    def list(self, request, *args, **kwargs):
+        self.page_version = menu_version()
+        key, headers = page_key(request, self.page_version)
+        if not_modified(request, headers):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        cache = catalogue_cache()
+        data = cache.get(key)
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            cache.set(key, data, app_setting('CATALOGUE_CACHE_TTL'))
+        return Response(data, headers=headers)
+
+    def reads_from_replica(self):
+        # with ReplicaReadMixin: a replica still behind the change that made the version would have its
+        # old rows cached under the new version, pages of a version younger than REPLICA_MAX_LAG seconds
+        # are filled from the primary
+        return time.time() * 1000 - self.page_version >= app_setting('REPLICA_MAX_LAG') * 1000
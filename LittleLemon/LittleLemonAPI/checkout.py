@@ -0,0 +1,53 @@
+import decimal
+from collections import namedtuple
+from django.db import connection, transaction
+from . import models
+from .events import publish_order_event
+
+CheckoutResult = namedtuple('CheckoutResult', ['order', 'statements'])
+
+class StatementCounter:
+    # counts every statement sent through the connection while active,
+    # this is what the checkout reports so tests can pin the round trips
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._wrapper.__exit__(*exc_info)
+
+def place_order(user):
+    """
+    Turn the user's cart into an order in one transaction:
+    read and lock the cart, insert the order with its total, bulk insert the
+    order items and clear the cart rows that were read.
+    Returns a CheckoutResult, its order is None when the cart is empty.
+    """
+    with StatementCounter() as counter, transaction.atomic():
+        # locked until the commit: a concurrent checkout of the same cart waits and then finds it empty,
+        # SQLite's IMMEDIATE transactions already serialize them and ignore FOR UPDATE
+        cart_items = list(
+            models.Cart.objects.select_for_update().filter(user=user).order_by('id')
+            .values_list('id', 'menuitem_id', 'quantity', 'unit_price', 'price')
+        )
+        if not cart_items:
+            return CheckoutResult(None, counter.count)
+
+        total = sum((item[4] for item in cart_items), decimal.Decimal(0))
+        order = models.Order.objects.create(user=user, total=total)
+        models.OrderItem.objects.bulk_create([
+            models.OrderItem(order=order, menuitem_id=menuitem_id, quantity=quantity, unit_price=unit_price, price=price)
+            for _, menuitem_id, quantity, unit_price, price in cart_items
+        ])
+        # only the rows that went into the order are removed, an item added concurrently stays in the cart
+        models.Cart.objects.filter(id__in=[item[0] for item in cart_items]).delete()
+        publish_order_event(order, 'order.created')
+    return CheckoutResult(order, counter.count)
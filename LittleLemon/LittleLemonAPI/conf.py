@@ -0,0 +1,93 @@
+from django.conf import settings
+
+# defaults for the LITTLELEMON settings dict, any key can be overridden in settings.py
+DEFAULTS = {
+    # process-local role cache, TTL is in seconds
+    'ROLE_CACHE_SIZE': 10000,
+    'ROLE_CACHE_TTL': 60,
+    # name of a django cache (CACHES alias) shared by all workers, used instead of the local one so a role
+    # change applies to every worker at once; None keeps the local cache, other workers then learn after its TTL
+    'ROLE_SHARED_CACHE': None,
+    'ROLE_SHARED_CACHE_TTL': 300,
+    # token -> user cache in front of the authtoken table; with a shared cache only that tier is used, so a
+    # logout or deactivation applies to every worker at once, without one other workers learn about it after the TTL
+    'TOKEN_CACHE_SIZE': 10000,
+    'TOKEN_CACHE_TTL': 60,
+    'TOKEN_SHARED_CACHE': None,
+    'TOKEN_SHARED_CACHE_TTL': 300,
+    # django cache (CACHES alias) holding the menu version and the cached menu pages, shared by every
+    # worker (redis, memcached) for menu changes to reach all of them at once
+    'CATALOGUE_CACHE': 'default',
+    'CATALOGUE_CACHE_TTL': 600,
+    # seconds the menu version lives in a process-local (locmem) catalogue cache, how long
+    # other workers may serve a menu changed by one of them
+    'CATALOGUE_VERSION_TTL': 5,
+    # seconds the read replica may lag behind, menu pages of a newer menu version are read from the primary
+    'REPLICA_MAX_LAG': 10,
+    # rows validated and written per transaction by the bulk menu import
+    'IMPORT_CHUNK_SIZE': 500,
+    # seconds a stored Idempotency-Key response is replayed for
+    'IDEMPOTENCY_TTL': 86400,
+    # seconds after which a key still in progress counts as abandoned by a worker that died
+    'IDEMPOTENCY_LOCK_TIMEOUT': 60,
+    # users one bulk group membership request may add or remove
+    'GROUP_BULK_MAX_USERS': 1000,
+    # upper bound for the quantity of a cart line, order prices are stored with 6 digits
+    'CART_MAX_QUANTITY': 99,
+    # lines one batch add to the cart may carry, two bound parameters each
+    'CART_BATCH_MAX_ITEMS': 100,
+    # rows fetched per database round trip by the streaming exports
+    'EXPORT_CHUNK_SIZE': 2000,
+    # fold every new order into the sales rollups right after its commit, with False
+    # the rollups only move when `manage.py rollup_sales` runs
+    'ROLLUP_ON_WRITE': True,
+    'ROLLUP_BATCH_SIZE': 1000,
+    # seconds an id skipped by the watermark waits for its order to commit, longer than any transaction
+    'ROLLUP_GAP_TIMEOUT': 3600,
+    # `manage.py archive_orders` moves delivered orders older than this many days out of the order
+    # tables, ARCHIVE_BATCH_SIZE orders per transaction
+    'ARCHIVE_AFTER_DAYS': 365,
+    'ARCHIVE_BATCH_SIZE': 1000,
+    # dotted path of the backend running the jobs of LittleLemonAPI.jobs: ImmediateBackend runs them
+    # right after the commit in the process that queued them, so the request still waits for them (checkout
+    # included); DatabaseBackend queues them for `manage.py run_jobs` and the request returns once committed
+    'JOB_BACKEND': 'LittleLemonAPI.jobs.ImmediateBackend',
+    # worker processes of run_jobs and the seconds an idle worker waits before looking again
+    'JOB_PROCESSES': 2,
+    'JOB_POLL_INTERVAL': 1.0,
+    # seconds before the first retry of a failed job, doubling up to the max
+    'JOB_RETRY_DELAY': 5,
+    'JOB_RETRY_MAX_DELAY': 3600,
+    # seconds after which a running job is considered abandoned by its worker and run again
+    'JOB_TIMEOUT': 600,
+    # dotted path of the menu search backend (LittleLemonAPI.search), None picks FTS5 on SQLite
+    # and SearchFilter's LIKE scans elsewhere
+    'SEARCH_BACKEND': None,
+    # dotted path of the broker carrying order events to the SSE streams (LittleLemonAPI.events),
+    # the local one only reaches the streams of its own process
+    'EVENT_BROKER': 'LittleLemonAPI.events.LocalBroker',
+    # events kept for Last-Event-ID replay and events queued per stream before a slow client is reset
+    'EVENTS_HISTORY_SIZE': 1000,
+    'EVENTS_QUEUE_SIZE': 100,
+    # seconds between heartbeat comments and before a stream ends and the client reconnects;
+    # under WSGI every open stream holds a worker thread that long, under ASGI none
+    'EVENTS_HEARTBEAT': 15,
+    'EVENTS_STREAM_TIMEOUT': 300,
+    'EVENTS_RETRY_MS': 3000,
+    # share of requests recorded by metrics.InstrumentationMiddleware, 0 turns it off
+    'METRICS_SAMPLE_RATE': 1.0,
+    # sampled requests at least this slow are logged with their query fingerprints, None disables the log
+    'METRICS_SLOW_REQUEST_MS': 500,
+    # bearer token for /metrics, when None only staff sessions may read it
+    'METRICS_TOKEN': None,
+    # upper bound for ?page_size= in cursor pagination mode
+    'CURSOR_MAX_PAGE_SIZE': 100,
+    # where throttle counters live: 'cache' (THROTTLE_CACHE alias) or 'sqlite' (THROTTLE_SQLITE_PATH,
+    # BASE_DIR / 'throttle.sqlite3' when None) for several workers on one host without a shared cache
+    'THROTTLE_STORE': 'cache',
+    'THROTTLE_CACHE': 'default',
+    'THROTTLE_SQLITE_PATH': None,
+}
+
+def app_setting(name):
+    return getattr(settings, 'LITTLELEMON', {}).get(name, DEFAULTS[name])
@@ -0,0 +1,89 @@
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.shortcuts import get_object_or_404
+from rest_framework import status
+from . import models
+from .events import publish_order_event
+from .models import OrderStatus
+from .roles import get_roles
+
+# allowed moves of the order lifecycle, a manager unassigning the crew sends an order back to placed
+TRANSITIONS = {
+    OrderStatus.PLACED: {OrderStatus.ASSIGNED},
+    OrderStatus.ASSIGNED: {OrderStatus.PLACED, OrderStatus.OUT_FOR_DELIVERY},
+    OrderStatus.OUT_FOR_DELIVERY: {OrderStatus.DELIVERED},
+    OrderStatus.DELIVERED: set(),
+}
+
+class OrderUpdateRejected(Exception):
+    def __init__(self, message, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+def update_order(order_id, user, changes):
+    """
+    Apply `changes`, an optional 'status' (OrderStatus) and an optional 'delivery_crew'
+    (username, empty to unassign), to an order under a row lock.
+    Managers may do both, the crew member of the order may only move its status.
+    Assigning a crew to a placed order makes it assigned and unassigning an
+    assigned order places it again, other status moves follow TRANSITIONS.
+    Fields missing from `changes` are left as they are.
+    Raises OrderUpdateRejected when the change is not allowed.
+    """
+    roles = get_roles(user)
+    with transaction.atomic():
+        order = get_object_or_404(models.Order.objects.select_for_update(), id=order_id)
+        is_crew = roles.is_delivery_crew and order.delivery_crew_id == user.id
+        if not roles.can_manage and not is_crew:
+            raise OrderUpdateRejected("You do not have permission to change order details", status.HTTP_401_UNAUTHORIZED)
+
+        target, previous_crew_id = order.status, order.delivery_crew_id
+        if 'delivery_crew' in changes:
+            if not roles.can_manage:
+                raise OrderUpdateRejected("You can not change delivery crew", status.HTTP_401_UNAUTHORIZED)
+            username = changes['delivery_crew']
+            if username:
+                crew = get_object_or_404(User, username=username)
+                if not get_roles(crew).is_delivery_crew:
+                    raise OrderUpdateRejected(username + " is not part of the delivery crew")
+                order.delivery_crew = crew
+                if order.status == OrderStatus.PLACED:
+                    target = OrderStatus.ASSIGNED
+            else:
+                order.delivery_crew = None
+                if order.status == OrderStatus.ASSIGNED:
+                    target = OrderStatus.PLACED
+
+        if 'status' in changes and changes['status'] != order.status:
+            target = changes['status']
+            if target not in TRANSITIONS[OrderStatus(order.status)]:
+                raise OrderUpdateRejected("An order can not go from %s to %s" % (OrderStatus(order.status).label, OrderStatus(target).label))
+        if (target == OrderStatus.PLACED) != (order.delivery_crew is None):
+            raise OrderUpdateRejected("An order is placed while it has no delivery crew and assigned or further along once it has one")
+
+        order.status = target
+        order.save(update_fields=['status', 'delivery_crew'])
+        publish_order_event(order, 'order.updated', previous_crew_id)
+    return order
+
+def waiting_orders():
+    # the dispatch queue, served by order_status_id_idx
+    return models.Order.objects.filter(status=OrderStatus.PLACED).order_by('id')
+
+def claim_next(user):
+    """
+    Assign the oldest placed order to `user` and return it, None when the queue is empty.
+    Concurrent claims never get the same order: rows locked by another claim are skipped
+    where the database supports SKIP LOCKED, SQLite serializes the write transactions.
+    """
+    with transaction.atomic():
+        queryset = waiting_orders().select_for_update(skip_locked=connection.features.has_select_for_update_skip_locked)
+        order = queryset.first()
+        if order is None:
+            return None
+        order.status = OrderStatus.ASSIGNED
+        order.delivery_crew = user
+        order.save(update_fields=['status', 'delivery_crew'])
+        publish_order_event(order, 'order.updated')
+    return order
@@ -0,0 +1,276 @@
+"""
+Order events pushed to clients as Server-Sent Events.
+
+Events are published after commit to channels, 'user:<id>' for the customer
+and the delivery crew of the order and 'managers', through the broker named by
+the EVENT_BROKER setting. LocalBroker, the default, is an in-process pub/sub
+with a bounded history for Last-Event-ID replay: it reaches the streams served
+by the same process only, a broker shared by every worker (redis pub/sub for
+instance) plugs in by implementing the Broker interface.
+
+Streams carry everything they send in the event itself, so the database
+connection is released before streaming starts and never used again. Under
+WSGI a stream holds a worker thread for up to EVENTS_STREAM_TIMEOUT seconds;
+under ASGI it is an async iterator waiting on the event loop, holding no thread.
+"""
+import asyncio
+import itertools
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+from asgiref.sync import sync_to_async
+from django.db import connections, transaction
+from django.http import StreamingHttpResponse
+from django.utils.module_loading import import_string
+from .conf import app_setting
+from .renderers import FastJSONRenderer
+from .roles import get_roles
+from .streaming import StreamRenderer
+
+Event = namedtuple('Event', ['id', 'type', 'channels', 'data'])
+
+MANAGERS = 'managers'
+
+# sent to a stream when the events it missed can no longer be replayed, the client refetches instead
+RESET = 'reset'
+
+def user_channel(user_id):
+    return 'user:%s' % user_id
+
+class Broker:
+    def publish(self, channels, event_type, data):
+        raise NotImplementedError('.publish() must be overridden')
+
+    def subscribe(self, channels):
+        """
+        A subscription to the given channels, its get(timeout) returns the next event
+        or None after timeout seconds, close() ends it. Streams served under ASGI await
+        its aget(timeout) instead when it has one, get() in a thread otherwise.
+        """
+        raise NotImplementedError('.subscribe() must be overridden')
+
+    def replay(self, channels, after_id):
+        # events of the channels published after after_id, None when they are no longer all known
+        raise NotImplementedError('.replay() must be overridden')
+
+class LocalSubscription:
+    def __init__(self, broker, channels, size):
+        self.broker = broker
+        self.channels = channels
+        self.events = queue.Queue(size)
+        self.overflowed = False
+        # (loop, asyncio.Event) of an aget() waiting for the next event
+        self._waiter = None
+
+    def put(self, event):
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            # a client too slow to keep up is reset instead of growing the queue
+            self.overflowed = True
+        waiter = self._waiter
+        if waiter is not None:
+            loop, ready = waiter
+            try:
+                loop.call_soon_threadsafe(ready.set)
+            except RuntimeError:
+                # the loop is closed, nobody waits anymore
+                pass
+
+    def get(self, timeout):
+        if self.overflowed:
+            return Event(None, RESET, self.channels, {})
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def aget(self, timeout):
+        # get() without a thread: publishers wake the waiting loop up
+        ready = asyncio.Event()
+        self._waiter = (asyncio.get_running_loop(), ready)
+        try:
+            # looked at after the waiter is set, an event put just before is not missed
+            event = self.get(timeout=0)
+            if event is None:
+                try:
+                    await asyncio.wait_for(ready.wait(), timeout)
+                except asyncio.TimeoutError:
+                    return None
+                event = self.get(timeout=0)
+            return event
+        finally:
+            self._waiter = None
+
+    def close(self):
+        self.broker._unsubscribe(self)
+
+class LocalBroker(Broker):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._history = deque(maxlen=app_setting('EVENTS_HISTORY_SIZE'))
+        self._subscriptions = {}
+        self._last_id = 0
+        # events up to this id are unknown here: published before the process started or dropped from the history
+        self._horizon = int(time.time() * 1000)
+
+    def _next_id(self):
+        # millisecond based, a restarted process keeps handing out ids above the ones clients saw
+        self._last_id = max(self._last_id + 1, int(time.time() * 1000))
+        return self._last_id
+
+    def publish(self, channels, event_type, data):
+        with self._lock:
+            event = Event(self._next_id(), event_type, frozenset(channels), data)
+            if len(self._history) == self._history.maxlen:
+                self._horizon = self._history[0].id
+            self._history.append(event)
+            subscriptions = set(itertools.chain.from_iterable(self._subscriptions.get(channel, ()) for channel in event.channels))
+        for subscription in subscriptions:
+            subscription.put(event)
+        return event
+
+    def subscribe(self, channels):
+        subscription = LocalSubscription(self, frozenset(channels), app_setting('EVENTS_QUEUE_SIZE'))
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscriptions.get(channel, set())
+                subscribers.discard(subscription)
+                if not subscribers:
+                    self._subscriptions.pop(channel, None)
+
+    def replay(self, channels, after_id):
+        with self._lock:
+            if after_id < self._horizon:
+                return None
+            history = list(self._history)
+        return [event for event in history if event.id > after_id and event.channels & channels]
+
+_broker = None
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(app_setting('EVENT_BROKER'))()
+    return _broker
+
+def publish_order_event(order, event_type, previous_crew_id=None):
+    """
+    Publish an event about `order` to its customer, its delivery crew (the previous one
+    as well when it changed) and the managers once the current transaction commits.
+    """
+    channels = {MANAGERS, user_channel(order.user_id)}
+    for crew_id in (order.delivery_crew_id, previous_crew_id):
+        if crew_id is not None:
+            channels.add(user_channel(crew_id))
+    data = {
+        'id': order.id,
+        'status': order.get_status_display(),
+        'delivery_crew': order.delivery_crew.username if order.delivery_crew_id else None,
+    }
+    transaction.on_commit(lambda: get_broker().publish(channels, event_type, data), robust=True)
+
+def subscribed_channels(user):
+    channels = {user_channel(user.id)}
+    if get_roles(user).can_manage:
+        channels.add(MANAGERS)
+    return frozenset(channels)
+
+def format_event(event):
+    lines = []
+    if event.id is not None:
+        lines.append('id: %s' % event.id)
+    lines.append('event: %s' % event.type)
+    lines.append('data: %s' % FastJSONRenderer().render(event.data).decode())
+    return ('\n'.join(lines) + '\n\n').encode()
+
+def _opening(subscription, channels, last_event_id):
+    # the first frames of a stream and the id of the last replayed event
+    frames, replayed = [b'retry: %d\n\n' % app_setting('EVENTS_RETRY_MS')], 0
+    if last_event_id is not None:
+        missed = subscription.broker.replay(channels, last_event_id)
+        if missed is None:
+            frames.append(format_event(Event(None, RESET, channels, {})))
+        else:
+            for event in missed:
+                replayed = event.id
+                frames.append(format_event(event))
+    return frames, replayed
+
+def _live(event, replayed):
+    # the frame for what the subscription returned, None for an event already replayed
+    if event is None:
+        return b': heartbeat\n\n'
+    if event.type == RESET or event.id > replayed:
+        return format_event(event)
+    return None
+
+def event_stream(subscription, channels, last_event_id):
+    """
+    The SSE body: the events missed since last_event_id, then live events with a
+    comment line as heartbeat, for at most EVENTS_STREAM_TIMEOUT seconds after
+    which the client reconnects with Last-Event-ID.
+    """
+    heartbeat, deadline = app_setting('EVENTS_HEARTBEAT'), time.monotonic() + app_setting('EVENTS_STREAM_TIMEOUT')
+    try:
+        frames, replayed = _opening(subscription, channels, last_event_id)
+        yield from frames
+        while time.monotonic() < deadline:
+            event = subscription.get(timeout=min(heartbeat, max(deadline - time.monotonic(), 0)))
+            frame = _live(event, replayed)
+            if frame is not None:
+                yield frame
+            if event is not None and event.type == RESET:
+                return
+    finally:
+        subscription.close()
+
+async def aevent_stream(subscription, channels, last_event_id):
+    # event_stream for ASGI servers, waiting for events holds no thread
+    heartbeat, deadline = app_setting('EVENTS_HEARTBEAT'), time.monotonic() + app_setting('EVENTS_STREAM_TIMEOUT')
+    get = getattr(subscription, 'aget', None) or sync_to_async(subscription.get, thread_sensitive=False)
+    try:
+        # a shared broker's replay may do network I/O
+        frames, replayed = await sync_to_async(_opening, thread_sensitive=False)(subscription, channels, last_event_id)
+        for frame in frames:
+            yield frame
+        while time.monotonic() < deadline:
+            event = await get(min(heartbeat, max(deadline - time.monotonic(), 0)))
+            frame = _live(event, replayed)
+            if frame is not None:
+                yield frame
+            if event is not None and event.type == RESET:
+                return
+    finally:
+        subscription.close()
+
+def release_connections():
+    # a stream may stay open for minutes, it must not keep a database connection busy meanwhile;
+    # connections inside an atomic block (tests, ATOMIC_REQUESTS) are left alone
+    for connection in connections.all(initialized_only=True):
+        if not connection.in_atomic_block:
+            connection.close()
+
+def event_response(user, last_event_id, asynchronous=False):
+    # asynchronous when the server is an ASGI one, which iterates the body on its event loop
+    channels = subscribed_channels(user)
+    # subscribed before the replay is read, an event published in between is delivered once
+    subscription = get_broker().subscribe(channels)
+    release_connections()
+    stream = (aevent_stream if asynchronous else event_stream)(subscription, channels, last_event_id)
+    response = StreamingHttpResponse(stream, content_type=EventStreamRenderer.media_type)
+    response['Cache-Control'] = 'no-cache'
+    # tells nginx not to buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+class EventStreamRenderer(StreamRenderer):
+    media_type = 'text/event-stream'
+    format = 'event-stream'
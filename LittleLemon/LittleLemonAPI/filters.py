@@ -0,0 +1,14 @@
+import django_filters
+from . import models
+
+class OrderFilter(django_filters.FilterSet):
+    # declared without a model, the same filters apply to Order and ArchivedOrder
+    # ?status= takes the OrderStatus names used in the responses
+    status = django_filters.ChoiceFilter(field_name='status', choices=[(label, label) for label in models.OrderStatus.labels], method='filter_status')
+    # date__gte / date__lte bound a date range
+    date = django_filters.DateFilter(field_name='date')
+    date__gte = django_filters.DateFilter(field_name='date', lookup_expr='gte')
+    date__lte = django_filters.DateFilter(field_name='date', lookup_expr='lte')
+
+    def filter_status(self, queryset, name, value):
+        return queryset.filter(status=models.OrderStatus.values[models.OrderStatus.labels.index(value)])
@@ -0,0 +1,115 @@
+"""
+Idempotency-Key support for writes that clients retry.
+
+The first request with a given key claims it by inserting a row, unique per
+user and key, before the view runs; the view's response is then stored on the
+row. A retry with the same key and the same request gets the stored response
+back without the view running again, a request arriving while the first one is
+still running gets 409 and a key reused for a different request 422. Only
+successful responses are stored: an error response, 4xx or 5xx, or an
+exception releases the key so the request can be retried once its cause is
+fixed. A key still in progress after IDEMPOTENCY_LOCK_TIMEOUT seconds was
+left by a worker that died and is claimed again. Keys expire after
+IDEMPOTENCY_TTL seconds, expired rows are removed now and then by the claims.
+"""
+import datetime
+import functools
+import hashlib
+import json
+import random
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from . import models
+from .conf import app_setting
+from .renderers import FastJSONRenderer
+
+HEADER = 'Idempotency-Key'
+
+# set on responses that are a replay of the stored one
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+MAX_KEY_LENGTH = 255
+
+# share of the claims that also delete the expired keys
+CLEANUP_PROBABILITY = 0.01
+
+def fingerprint(request):
+    digest = hashlib.sha256()
+    for part in (request.method, request.get_full_path(), request.body):
+        digest.update(part if isinstance(part, bytes) else part.encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def _expiry():
+    return timezone.now() - datetime.timedelta(seconds=app_setting('IDEMPOTENCY_TTL'))
+
+def _abandoned(claimed):
+    return claimed.status_code is None and claimed.created < timezone.now() - datetime.timedelta(seconds=app_setting('IDEMPOTENCY_LOCK_TIMEOUT'))
+
+def _claim(user, key, request_fingerprint):
+    """
+    The row for (user, key) and whether this request created it: a committed insert
+    is what makes concurrent requests with the same key run the view only once.
+    """
+    if random.random() < CLEANUP_PROBABILITY:
+        models.IdempotencyKey.objects.filter(created__lt=_expiry()).delete()
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return models.IdempotencyKey.objects.create(user=user, key=key, fingerprint=request_fingerprint), True
+        except IntegrityError:
+            existing = models.IdempotencyKey.objects.filter(user=user, key=key).first()
+            if existing is None:
+                # released in between, claim again
+                continue
+            if existing.created < _expiry() or _abandoned(existing):
+                # unless its request finished in the meantime
+                models.IdempotencyKey.objects.filter(pk=existing.pk, status_code=existing.status_code).delete()
+                continue
+            return existing, False
+    return None, False
+
+def _replay(claimed, request_fingerprint):
+    if claimed is None or claimed.status_code is None:
+        response = Response({"message": "A request with this Idempotency-Key is still in progress"}, status=status.HTTP_409_CONFLICT)
+        response['Retry-After'] = '1'
+        return response
+    if claimed.fingerprint != request_fingerprint:
+        return Response({"message": "This Idempotency-Key was used for a different request"}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    response = Response(json.loads(claimed.response) if claimed.response else None, status=claimed.status_code)
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+def idempotent(handler):
+    """
+    View method decorator: requests carrying an Idempotency-Key header run the handler
+    at most once per user and key, see the module docstring. Requests without the
+    header are not affected.
+    """
+    @functools.wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None or not request.user.is_authenticated:
+            return handler(view, request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response({"message": "Idempotency-Key must be 1 to %d characters long" % MAX_KEY_LENGTH}, status=status.HTTP_400_BAD_REQUEST)
+
+        # read before the view parses it, the raw body stays available afterwards
+        request_fingerprint = fingerprint(request)
+        claimed, created = _claim(request.user, key, request_fingerprint)
+        if not created:
+            return _replay(claimed, request_fingerprint)
+        try:
+            response = handler(view, request, *args, **kwargs)
+        except BaseException:
+            claimed.delete()
+            raise
+        if response.status_code >= 400:
+            claimed.delete()
+            return response
+        body = FastJSONRenderer().render(response.data).decode() if response.data is not None else None
+        models.IdempotencyKey.objects.filter(pk=claimed.pk).update(status_code=response.status_code, response=body)
+        return response
+    return wrapper
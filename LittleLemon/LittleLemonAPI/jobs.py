@@ -0,0 +1,157 @@
+"""
+Background jobs for the work that follows a write but does not need to hold up
+its response.
+
+A function decorated with @task is still called as usual; task.enqueue(*args)
+runs it later instead, once the current transaction commits, so a rolled back
+write never leaves a job behind. Arguments must be JSON serializable.
+
+The JOB_BACKEND setting decides where enqueued jobs go. ImmediateBackend, the
+default, runs them in the committing process right away, so the request that
+queued them still waits for them after its commit. DatabaseBackend stores them
+in the Job table, from which `manage.py run_jobs` workers claim them with
+SELECT ... FOR UPDATE SKIP LOCKED where the database supports it, and the
+request responds as soon as its transaction commits. Failed jobs are retried
+with exponential backoff up to the task's max_attempts and then kept as
+failed; jobs left running by a worker that died are claimed again after
+JOB_TIMEOUT seconds. A worker only finishes a job it still holds the lock of,
+a job it lost meanwhile is left to its new worker.
+"""
+import datetime
+import functools
+import logging
+import random
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from . import models
+from .conf import app_setting
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+class Task:
+    def __init__(self, func, max_attempts, unique):
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.name = '%s.%s' % (func.__module__, func.__qualname__)
+        self.max_attempts = max_attempts
+        # a unique task is not queued again while the same call is still waiting
+        self.unique = unique
+
+    def __call__(self, *args):
+        return self.func(*args)
+
+    def enqueue(self, *args):
+        args = list(args)
+        transaction.on_commit(lambda: get_backend().push(self, args), robust=True)
+
+def task(max_attempts=5, unique=False):
+    def decorator(func):
+        registered = Task(func, max_attempts, unique)
+        _registry[registered.name] = registered
+        return registered
+    return decorator
+
+def get_task(name):
+    # tasks of modules not imported yet are found by their dotted path
+    if name not in _registry:
+        import_string(name)
+    return _registry[name]
+
+class ImmediateBackend:
+    def push(self, task, args):
+        task(*args)
+
+class DatabaseBackend:
+    def push(self, task, args):
+        if task.unique and models.Job.objects.filter(name=task.name, args=args, status=models.JobStatus.QUEUED, attempts=0).exists():
+            return
+        models.Job.objects.create(name=task.name, args=args, max_attempts=task.max_attempts)
+
+_backend = None
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(app_setting('JOB_BACKEND'))()
+    return _backend
+
+def backoff(attempts):
+    # seconds before the next attempt: doubling from JOB_RETRY_DELAY, capped, with jitter so failed jobs spread out
+    delay = min(app_setting('JOB_RETRY_DELAY') * 2 ** (attempts - 1), app_setting('JOB_RETRY_MAX_DELAY'))
+    return delay * random.uniform(0.5, 1)
+
+def claim():
+    """
+    Lock the next runnable job for this worker and return it, None when there is
+    none: a queued job whose time has come, or a running one that timed out.
+    """
+    now = timezone.now()
+    stale = now - datetime.timedelta(seconds=app_setting('JOB_TIMEOUT'))
+    with transaction.atomic():
+        job = (
+            models.Job.objects.select_for_update(skip_locked=connection.features.has_select_for_update_skip_locked)
+            .filter(Q(status=models.JobStatus.QUEUED, run_at__lte=now) | Q(status=models.JobStatus.RUNNING, locked_at__lt=stale))
+            .order_by('run_at', 'id').first()
+        )
+        if job is None:
+            return None
+        job.status = models.JobStatus.RUNNING
+        job.locked_at = now
+        job.attempts += 1
+        job.save(update_fields=['status', 'locked_at', 'attempts'])
+    return job
+
+def run(job):
+    """
+    Run a claimed job: done jobs are deleted, failed ones queued again after a
+    backoff or, on their last attempt, kept as failed with the error; both only
+    if this worker still holds the job's lock.
+    """
+    locked = models.Job.objects.filter(pk=job.pk, locked_at=job.locked_at)
+    try:
+        get_task(job.name)(*job.args)
+    except Exception as exc:
+        logger.exception("job %s (%d) failed, attempt %d of %d", job.name, job.id, job.attempts, job.max_attempts)
+        if job.attempts >= job.max_attempts:
+            changes = {'status': models.JobStatus.FAILED}
+        else:
+            changes = {'status': models.JobStatus.QUEUED, 'run_at': timezone.now() + datetime.timedelta(seconds=backoff(job.attempts))}
+        if not locked.update(locked_at=None, last_error='%s: %s' % (type(exc).__name__, exc), **changes):
+            logger.warning("job %s (%d) lost its lock while it ran, its failure is not recorded", job.name, job.id)
+        return False
+    if not locked.delete()[0]:
+        logger.warning("job %s (%d) lost its lock while it ran, another worker runs it again", job.name, job.id)
+    return True
+
+def run_pending(limit=None):
+    # runs jobs until none is runnable (or limit jobs ran), returns the number run
+    count = 0
+    while limit is None or count < limit:
+        job = claim()
+        if job is None:
+            break
+        run(job)
+        count += 1
+    return count
+
+def work(stop, poll_interval):
+    # a worker's loop, until the stop event is set; errors outside the jobs (the database
+    # going away or staying locked) are logged and retried with backoff instead of ending it
+    failures = 0
+    while not stop.is_set():
+        try:
+            ran = run_pending()
+        except Exception:
+            failures += 1
+            logger.exception("job worker error, retrying")
+            # drops the connection if the error broke it, the next query opens a new one
+            close_old_connections()
+            stop.wait(backoff(failures))
+            continue
+        failures = 0
+        if not ran:
+            stop.wait(poll_interval)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from LittleLemonAPI import archive
+
+class Command(BaseCommand):
+    help = 'Move delivered orders older than the archive horizon, with their lines, to the archive tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Archive orders dated more than this many days ago (ARCHIVE_AFTER_DAYS by default).')
+        parser.add_argument('--batch-size', type=int, default=None, help='Orders per transaction (ARCHIVE_BATCH_SIZE by default).')
+
+    def handle(self, *args, **options):
+        moved = archive.archive_orders(archive.horizon(options['days']), options['batch_size'])
+        self.stdout.write('%d orders archived' % moved)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from LittleLemonAPI import search
+from LittleLemonAPI.catalogue import bump_menu_version
+
+class Command(BaseCommand):
+    help = 'Rebuild the menu search index from the menu items.'
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        with transaction.atomic():
+            backend.rebuild()
+            # cached search pages may have been served from a stale index
+            transaction.on_commit(bump_menu_version)
+        self.stdout.write('Menu search index rebuilt with %s' % type(backend).__name__)
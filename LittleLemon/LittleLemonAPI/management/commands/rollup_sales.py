@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from LittleLemonAPI import analytics
+
+class Command(BaseCommand):
+    help = 'Fold the orders created since the last run into the daily sales rollups.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Orders per transaction (ROLLUP_BATCH_SIZE by default).')
+        parser.add_argument('--rebuild', action='store_true', help='Empty the rollups and count every order again.')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            counted = analytics.rebuild(options['batch_size'])
+        else:
+            counted = analytics.catch_up(options['batch_size'])
+        self.stdout.write('%d orders counted' % counted)
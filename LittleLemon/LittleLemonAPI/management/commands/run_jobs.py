@@ -0,0 +1,79 @@
+import multiprocessing
+import signal
+import time
+from django.core.management.base import BaseCommand
+from django.db import connections
+from LittleLemonAPI import jobs
+from LittleLemonAPI.conf import app_setting
+
+class _Stop:
+    # the stop event of a worker, set by SIGTERM: a flag, no lock a signal handler could wait on forever
+    def __init__(self):
+        self.stopped = False
+
+    def set(self, *args):
+        self.stopped = True
+
+    def is_set(self):
+        return self.stopped
+
+    def wait(self, timeout):
+        deadline = time.monotonic() + timeout
+        while not self.stopped and time.monotonic() < deadline:
+            time.sleep(min(0.1, max(deadline - time.monotonic(), 0)))
+        return self.stopped
+
+def _worker(poll_interval):
+    # the parent stops the workers with SIGTERM, a ctrl-c reaching the whole group is left to it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    stop = _Stop()
+    signal.signal(signal.SIGTERM, stop.set)
+    try:
+        jobs.work(stop, poll_interval)
+    finally:
+        connections.close_all()
+
+class Command(BaseCommand):
+    help = 'Run the background jobs queued with the database job backend (JOB_BACKEND).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None, help='Worker processes (JOB_PROCESSES by default).')
+        parser.add_argument('--poll-interval', type=float, default=None, help='Seconds an idle worker waits before looking again (JOB_POLL_INTERVAL by default).')
+        parser.add_argument('--once', action='store_true', help='Run the jobs that are due in this process and exit.')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            self.stdout.write('%d jobs run' % jobs.run_pending())
+            return
+        processes = options['processes'] or app_setting('JOB_PROCESSES')
+        poll_interval = options['poll_interval'] if options['poll_interval'] is not None else app_setting('JOB_POLL_INTERVAL')
+        # connections opened so far must not be shared with the forked workers
+        connections.close_all()
+        workers = [self.start_worker(poll_interval) for _ in range(processes)]
+        terminated = []
+        previous = signal.signal(signal.SIGTERM, lambda signum, frame: terminated.append(signum))
+        self.stdout.write('%d workers started' % processes)
+        try:
+            while not terminated:
+                time.sleep(1)
+                # a worker that died (killed, out of memory) is replaced
+                for index, worker in enumerate(workers):
+                    if not worker.is_alive() and not terminated:
+                        self.stderr.write('worker %d exited with code %s, restarting it' % (worker.pid, worker.exitcode))
+                        workers[index] = self.start_worker(poll_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # a worker finishes the job it is running before it exits
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                worker.join()
+            signal.signal(signal.SIGTERM, previous)
+        self.stdout.write('workers stopped')
+
+    @staticmethod
+    def start_worker(poll_interval):
+        worker = multiprocessing.Process(target=_worker, args=(poll_interval,), daemon=True)
+        worker.start()
+        return worker
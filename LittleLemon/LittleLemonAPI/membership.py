@@ -0,0 +1,70 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from .roles import group_id, invalidate_roles
+
+Membership = User.groups.through
+
+ADDED = 'added'
+ALREADY_MEMBER = 'already a member'
+REMOVED = 'removed'
+NOT_MEMBER = 'not a member'
+MISSING = 'does not exist'
+
+def _resolve(identifiers):
+    # ids (int) and usernames (str) to user ids in one query, None for unknown users
+    ids = [identifier for identifier in identifiers if isinstance(identifier, int)]
+    names = [identifier for identifier in identifiers if isinstance(identifier, str)]
+    rows = list(User.objects.filter(Q(id__in=ids) | Q(username__in=names)).values_list('id', 'username'))
+    by_id = {user_id: user_id for user_id, _ in rows}
+    by_name = {username: user_id for user_id, username in rows}
+    return {identifier: (by_id if isinstance(identifier, int) else by_name).get(identifier) for identifier in identifiers}
+
+def update_members(group_name, add=(), remove=()):
+    """
+    Add and remove users, each given by id or username, to the named group with a
+    constant number of queries whatever the number of users: one to resolve them,
+    one for their current memberships, one bulk insert and one delete.
+    Returns one {'user', 'id', 'result'} dict per identifier, in request order.
+    Raises ValueError when a user is both added and removed.
+    """
+    group = group_id(group_name)
+    users = _resolve(list(add) + list(remove))
+    added_ids = {users[identifier] for identifier in add} - {None}
+    removed_ids = {users[identifier] for identifier in remove} - {None}
+    if added_ids & removed_ids:
+        raise ValueError('A user can not be both added and removed')
+
+    results, to_add, to_remove = [], [], []
+    with transaction.atomic():
+        members = set(Membership.objects.filter(group_id=group, user_id__in=added_ids | removed_ids).values_list('user_id', flat=True))
+        for identifier in add:
+            user_id = users[identifier]
+            if user_id is None:
+                result = MISSING
+            elif user_id in members:
+                result = ALREADY_MEMBER
+            else:
+                result = ADDED
+                members.add(user_id)
+                to_add.append(user_id)
+            results.append({'user': identifier, 'id': user_id, 'result': result})
+        for identifier in remove:
+            user_id = users[identifier]
+            if user_id is None:
+                result = MISSING
+            elif user_id not in members:
+                result = NOT_MEMBER
+            else:
+                result = REMOVED
+                members.discard(user_id)
+                to_remove.append(user_id)
+            results.append({'user': identifier, 'id': user_id, 'result': result})
+
+        # through rows written directly send no m2m_changed, the roles are invalidated below
+        if to_add:
+            Membership.objects.bulk_create([Membership(user_id=user_id, group_id=group) for user_id in to_add], ignore_conflicts=True)
+        if to_remove:
+            Membership.objects.filter(group_id=group, user_id__in=to_remove).delete()
+    invalidate_roles(*to_add, *to_remove)
+    return results
@@ -0,0 +1,80 @@
+from collections import namedtuple
+from django.db import transaction
+from . import models
+from .catalogue import bump_menu_version
+from .conf import app_setting
+from .search import index_items
+from .serializers import MenuItemImportSerializer
+from .streaming import chunked
+
+ImportResult = namedtuple('ImportResult', ['created', 'updated', 'errors', 'error_count'])
+
+# the response lists the first errors only, error_count has the total
+MAX_REPORTED_ERRORS = 100
+
+def _clean(record):
+    # blank csv cells count as missing, columns without a header are ignored
+    return {key: value for key, value in record.items() if key is not None and value not in ('', None)}
+
+def import_menu(records, chunk_size=None):
+    """
+    Create or update menu items from (line number, record) pairs as produced by
+    streaming.iter_records. Records are validated and written one chunk at a
+    time, each chunk with one bulk_create, one bulk_update and the matching search
+    index update in its own transaction; category slugs are resolved with a single query up front.
+    Invalid rows are skipped and reported with their line number.
+    """
+    chunk_size = chunk_size or app_setting('IMPORT_CHUNK_SIZE')
+    # the first category wins when a slug is not unique
+    categories = dict(models.Category.objects.order_by('-id').values_list('slug', 'id'))
+    created = updated = error_count = 0
+    errors = []
+
+    def error(number, detail):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({'line': number, 'errors': detail})
+
+    for chunk in chunked(records, chunk_size):
+        rows = []
+        for number, record in chunk:
+            if record is None:
+                error(number, {'non_field_errors': ['Malformed row']})
+                continue
+            serialized_row = MenuItemImportSerializer(data=_clean(record))
+            if not serialized_row.is_valid():
+                error(number, serialized_row.errors)
+                continue
+            data = serialized_row.validated_data
+            category_id = categories.get(data['category'])
+            if category_id is None:
+                error(number, {'category': ['Category with slug %s does not exist' % data['category']]})
+                continue
+            rows.append((number, models.MenuItem(
+                id=data.get('id'), title=data['title'], price=data['price'], featured=data['featured'], category_id=category_id,
+            )))
+
+        ids = [item.id for _, item in rows if item.id is not None]
+        existing = set(models.MenuItem.objects.filter(id__in=ids).values_list('id', flat=True)) if ids else set()
+        new_items, changed_items = [], {}
+        for number, item in rows:
+            if item.id is None:
+                new_items.append(item)
+            elif item.id in existing:
+                # a later row for the same item wins
+                changed_items[item.id] = item
+            else:
+                error(number, {'id': ['Menu item with id %d does not exist' % item.id]})
+
+        with transaction.atomic():
+            models.MenuItem.objects.bulk_create(new_items)
+            models.MenuItem.objects.bulk_update(changed_items.values(), ['title', 'price', 'featured', 'category'])
+            index_items([item.id for item in new_items] + list(changed_items))
+        created += len(new_items)
+        updated += len(changed_items)
+
+    if created or updated:
+        # bulk writes send no post_save, the menu cache is bumped here instead
+        transaction.on_commit(bump_menu_version)
+    return ImportResult(created, updated, errors, error_count)
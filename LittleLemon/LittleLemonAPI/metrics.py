@@ -0,0 +1,258 @@
+"""
+Request instrumentation, served in the Prometheus text format at /metrics.
+
+InstrumentationMiddleware records, per route and method, a latency histogram,
+the number and time of database queries, the time spent turning data into the
+response body and the response size. Queries go through an execute wrapper
+every connection gets when it opens; it records into the sample of the request
+whose context runs the query, so the queries of sync code run in a thread
+under ASGI count too. Only METRICS_SAMPLE_RATE of the requests are recorded,
+at 0 the middleware does nothing but call the next one. Requests slower than
+METRICS_SLOW_REQUEST_MS are logged with the fingerprints of their queries.
+
+Counters live in the process, every worker is scraped on its own.
+"""
+import contextvars
+import hmac
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import HttpResponse, HttpResponseForbidden
+from .conf import app_setting
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of the latency buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# requests that matched no url share one label, so scanners can not grow the label set
+UNMATCHED = '<unmatched>'
+
+# query fingerprints logged per slow request
+MAX_LOGGED_FINGERPRINTS = 10
+
+_current = contextvars.ContextVar('littlelemon_metrics_sample', default=None)
+
+class Sample:
+    # what one request did, filled while it runs
+    __slots__ = ('queries', 'query_time', 'serialize_time', 'statements')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.serialize_time = 0.0
+        self.statements = []
+
+def record_queries(execute, sql, params, many, context):
+    # execute wrapper of every connection, adds the query to the current request's sample, if it is sampled
+    sample = _current.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample.query_time += time.perf_counter() - start
+        sample.queries += 1
+        sample.statements.append(sql)
+
+def install_wrapper(sender, connection, **kwargs):
+    # connection_created receiver; the wrappers outlive a reconnection, install once
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
+
+@contextmanager
+def timed_serialization():
+    # adds the time of the block to the current request's serialization time, if it is sampled
+    sample = _current.get()
+    if sample is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        sample.serialize_time += time.perf_counter() - start
+
+def fingerprint(sql):
+    # the shape of a statement: literals and IN lists collapsed so repeats of one query group together
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    sql = re.sub(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)', '(...)', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+class RouteStats:
+    __slots__ = ('buckets', 'count', 'duration', 'queries', 'query_time', 'serialize_time', 'response_bytes', 'responses')
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.query_time = 0.0
+        self.serialize_time = 0.0
+        self.response_bytes = 0
+        self.responses = Counter()
+
+    def copy(self):
+        copy = RouteStats()
+        for name in self.__slots__:
+            setattr(copy, name, getattr(self, name))
+        copy.buckets, copy.responses = list(self.buckets), Counter(self.responses)
+        return copy
+
+def _labels(**labels):
+    escaped = (
+        '%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels.items()
+    )
+    return '{%s}' % ','.join(escaped)
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def observe(self, route, method, status_code, duration, sample, size):
+        with self._lock:
+            stats = self._routes.get((route, method))
+            if stats is None:
+                stats = self._routes[(route, method)] = RouteStats()
+            for index, bound in enumerate(BUCKETS):
+                if duration <= bound:
+                    stats.buckets[index] += 1
+                    break
+            stats.count += 1
+            stats.duration += duration
+            stats.queries += sample.queries
+            stats.query_time += sample.query_time
+            stats.serialize_time += sample.serialize_time
+            stats.response_bytes += size
+            stats.responses[status_code] += 1
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+
+    def render(self):
+        with self._lock:
+            snapshot = {key: stats.copy() for key, stats in self._routes.items()}
+        return ''.join(self._render(snapshot))
+
+    def _render(self, snapshot):
+        keys = sorted(snapshot)
+        yield '# HELP littlelemon_request_duration_seconds Time to produce the response of sampled requests.\n'
+        yield '# TYPE littlelemon_request_duration_seconds histogram\n'
+        for route, method in keys:
+            stats = snapshot[(route, method)]
+            cumulative = 0
+            for bound, count in zip(BUCKETS, stats.buckets):
+                cumulative += count
+                yield 'littlelemon_request_duration_seconds_bucket%s %d\n' % (_labels(route=route, method=method, le=bound), cumulative)
+            yield 'littlelemon_request_duration_seconds_bucket%s %d\n' % (_labels(route=route, method=method, le='+Inf'), stats.count)
+            yield 'littlelemon_request_duration_seconds_sum%s %r\n' % (_labels(route=route, method=method), stats.duration)
+            yield 'littlelemon_request_duration_seconds_count%s %d\n' % (_labels(route=route, method=method), stats.count)
+        yield '# HELP littlelemon_responses_total Sampled responses by status code.\n'
+        yield '# TYPE littlelemon_responses_total counter\n'
+        for route, method in keys:
+            for status_code, count in sorted(snapshot[(route, method)].responses.items()):
+                yield 'littlelemon_responses_total%s %d\n' % (_labels(route=route, method=method, status=status_code), count)
+        for name, attribute, kind, description in (
+            ('littlelemon_db_queries_total', 'queries', '%d', 'Database queries run by sampled requests.'),
+            ('littlelemon_db_query_seconds_total', 'query_time', '%r', 'Time spent in database queries by sampled requests.'),
+            ('littlelemon_serialization_seconds_total', 'serialize_time', '%r', 'Time spent building and rendering response bodies.'),
+            ('littlelemon_response_bytes_total', 'response_bytes', '%d', 'Size of the sampled response bodies, streamed bodies excluded.'),
+        ):
+            yield '# HELP %s %s\n' % (name, description)
+            yield '# TYPE %s counter\n' % name
+            for route, method in keys:
+                yield ('%s%s ' + kind + '\n') % (name, _labels(route=route, method=method), getattr(snapshot[(route, method)], attribute))
+
+REGISTRY = Registry()
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        sample, token, start = self.begin()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.end(request, response, sample, start)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        sample, token, start = self.begin()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.end(request, response, sample, start)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns, the rendering counts as serialization
+        sample = _current.get()
+        if sample is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                sample.serialize_time += time.perf_counter() - start
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    @staticmethod
+    def sampled():
+        rate = app_setting('METRICS_SAMPLE_RATE')
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    @staticmethod
+    def begin():
+        sample = Sample()
+        return sample, _current.set(sample), time.perf_counter()
+
+    def end(self, request, response, sample, start):
+        duration = time.perf_counter() - start
+        match = request.resolver_match
+        route = match.route if match is not None else UNMATCHED
+        size = 0 if response.streaming else len(response.content)
+        REGISTRY.observe(route, request.method, response.status_code, duration, sample, size)
+        threshold = app_setting('METRICS_SLOW_REQUEST_MS')
+        if threshold is not None and duration * 1000 >= threshold:
+            fingerprints = Counter(fingerprint(sql) for sql in sample.statements)
+            logger.warning(
+                "slow request %s %s: %.0f ms, %d queries in %.0f ms%s", request.method, request.path,
+                duration * 1000, sample.queries, sample.query_time * 1000,
+                ''.join('\n  %dx %s' % (count, sql) for sql, count in fingerprints.most_common(MAX_LOGGED_FINGERPRINTS)),
+            )
+
+def metrics_view(request):
+    # scraped with `Authorization: Bearer <METRICS_TOKEN>`, or by a staff user's session when no token is set
+    token = app_setting('METRICS_TOKEN')
+    if token:
+        allowed = hmac.compare_digest(request.headers.get('Authorization', ''), 'Bearer %s' % token)
+    else:
+        allowed = request.user.is_authenticated and request.user.is_staff
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+TABLE = 'littlelemon_menu_search'
+
+def fts5_available(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return 'ENABLE_FTS5' in {row[0] for row in cursor.fetchall()}
+
+def create_index(apps, schema_editor):
+    # SQLite only, other databases search through their own backend
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite' or not fts5_available(connection):
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(title, category, prefix='2 3', tokenize='unicode61 remove_diacritics 2')" % TABLE
+    )
+    schema_editor.execute("INSERT INTO %s (%s, rank) VALUES ('rank', 'bm25(10.0, 1.0)')" % (TABLE, TABLE))
+    schema_editor.execute(
+        'INSERT INTO %s (rowid, title, category) SELECT item.id, item.title, category.title '
+        'FROM "LittleLemonAPI_menuitem" item JOIN "LittleLemonAPI_category" category ON category.id = item.category_id' % TABLE
+    )
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS %s' % TABLE)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0006_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,62 @@
+from django.db import migrations, models
+
+PLACED, ASSIGNED, DELIVERED = 0, 1, 3
+
+def status_to_state(apps, schema_editor):
+    # delivered orders keep their status, the others are assigned when they have a delivery crew
+    Order = apps.get_model('LittleLemonAPI', 'Order')
+    Order.objects.filter(status=True).update(state=DELIVERED)
+    Order.objects.filter(status=False, delivery_crew__isnull=False).update(state=ASSIGNED)
+
+def state_to_status(apps, schema_editor):
+    Order = apps.get_model('LittleLemonAPI', 'Order')
+    Order.objects.filter(state=DELIVERED).update(status=True)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0007_menu_search_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_crew_status_id_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_status_date_idx',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='state',
+            field=models.PositiveSmallIntegerField(default=PLACED),
+        ),
+        migrations.RunPython(status_to_state, state_to_status),
+        migrations.RemoveField(
+            model_name='order',
+            name='status',
+        ),
+        migrations.RenameField(
+            model_name='order',
+            old_name='state',
+            new_name='status',
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'placed'), (1, 'assigned'), (2, 'out-for-delivery'), (3, 'delivered')], default=0),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['delivery_crew', 'status', 'id'], name='order_crew_status_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'date'], name='order_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'id'], name='order_status_id_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0011_order_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupGap',
+            fields=[
+                ('order_id', models.PositiveBigIntegerField(primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+from .roles import get_roles
 
 class Category(models.Model):
     slug = models.SlugField()
@@ -31,25 +32,164 @@ class Cart(models.Model):
     def __str__(self) -> str:
         return self.user.first_name + ": " + self.menuitem.title
         
-class Order(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
-    delivery_crew = models.ForeignKey(User, on_delete=models.SET_NULL, related_name="delivery_crew", null=True)
-    status = models.BooleanField(db_index=True, default=False)
+class OrderQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        # a single predicate per role, each one served by an index in Order.Meta.indexes
+        roles = get_roles(user)
+        if roles.can_manage:
+            return self
+        elif roles.is_delivery_crew:
+            return self.filter(models.Q(delivery_crew=user) | models.Q(user=user))
+        return self.filter(user=user)
+    
+    def with_details(self):
+        # everything OrderSerializer renders, fetched in a fixed number of queries whatever the page size
+        return self.select_related('user', 'delivery_crew').prefetch_related(
+            models.Prefetch('order_items', queryset=OrderItem.objects.select_related('menuitem').order_by('id'))
+        )
+        
+class OrderStatus(models.IntegerChoices):
+    # the labels are the names used by the API, dispatch.TRANSITIONS lists the allowed moves
+    PLACED = 0, 'placed'
+    ASSIGNED = 1, 'assigned'
+    OUT_FOR_DELIVERY = 2, 'out-for-delivery'
+    DELIVERED = 3, 'delivered'
+        
+class BaseOrder(models.Model):
+    # columns shared by Order and ArchivedOrder
+    status = models.PositiveSmallIntegerField(choices=OrderStatus.choices, default=OrderStatus.PLACED)
     total = models.DecimalField(max_digits=6, decimal_places=2)
     date = models.DateField(db_index=True, default=timezone.now)
+
+    class Meta:
+        abstract = True
+
+class Order(BaseOrder):
+    # user, delivery_crew and status are indexed through the composite indexes in Meta
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    delivery_crew = models.ForeignKey(User, on_delete=models.SET_NULL, related_name="delivery_crew", null=True, db_index=False)
+    
+    objects = OrderQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='order_user_id_idx'),
+            models.Index(fields=['delivery_crew', 'status', 'id'], name='order_crew_status_id_idx'),
+            models.Index(fields=['status', 'date'], name='order_status_date_idx'),
+            # the dispatch queue, placed orders oldest first
+            models.Index(fields=['status', 'id'], name='order_status_id_idx'),
+        ]
     
     def __str__(self) -> str:
         return str(self.id) + ": " + self.user.username
     
-class OrderItem(models.Model):
-    order = models.ForeignKey(Order, related_name='order_items', on_delete=models.CASCADE)
-    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+class BaseOrderItem(models.Model):
     quantity = models.SmallIntegerField()
     unit_price = models.DecimalField(max_digits=6, decimal_places=2)
     price = models.DecimalField(max_digits=6, decimal_places=2)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self) -> str:
+        return self.menuitem.title
+
+class OrderItem(BaseOrderItem):
+    order = models.ForeignKey(Order, related_name='order_items', on_delete=models.CASCADE)
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
     
     class Meta:
         unique_together = ('order', 'menuitem')
-        
-    def __str__(self) -> str:
-        return self.menuitem.title    
\ No newline at end of file
+
+# delivered orders moved out of the hot tables by archive.archive_orders, with their ids
+class ArchivedOrder(BaseOrder):
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    delivery_crew = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='+', null=True)
+
+class ArchivedOrderItem(BaseOrderItem):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, related_name='order_items', on_delete=models.CASCADE)
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name='+')
+# daily rollups maintained by analytics.py, the reports read only these tables
+class DailySales(models.Model):
+    date = models.DateField(unique=True)
+    order_count = models.PositiveIntegerField(default=0)
+    items_sold = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+class DailyMenuItemSales(models.Model):
+    date = models.DateField()
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('date', 'menuitem')
+
+class DailyCategorySales(models.Model):
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('date', 'category')
+
+class DailyDeliveryCrewOrders(models.Model):
+    date = models.DateField()
+    delivery_crew = models.ForeignKey(User, on_delete=models.CASCADE)
+    order_count = models.PositiveIntegerField(default=0)
+    delivered_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('date', 'delivery_crew')
+
+class RollupWatermark(models.Model):
+    # orders with an id up to order_id are counted in the rollups
+    name = models.CharField(max_length=50, unique=True)
+    order_id = models.PositiveBigIntegerField(default=0)
+
+class RollupGap(models.Model):
+    # an id below the watermark no order had when it moved past it, counted if its order commits later
+    order_id = models.PositiveBigIntegerField(primary_key=True)
+    created = models.DateTimeField(default=timezone.now, db_index=True)
+
+# responses of writes sent with an Idempotency-Key header, see idempotency.py
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    key = models.CharField(max_length=255)
+    # sha256 of the method, path and body the key was first used with
+    fingerprint = models.CharField(max_length=64)
+    # both empty while the first request is still running
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.TextField(null=True)
+    created = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        # also serves the lookups by user, hence no index on the foreign key
+        unique_together = ('user', 'key')
+
+class JobStatus(models.IntegerChoices):
+    QUEUED = 0, 'queued'
+    RUNNING = 1, 'running'
+    FAILED = 2, 'failed'
+
+# background jobs of the database backend, see jobs.py; done jobs are deleted
+class Job(models.Model):
+    # dotted path of the task function
+    name = models.CharField(max_length=255)
+    args = models.JSONField(default=list)
+    status = models.PositiveSmallIntegerField(choices=JobStatus.choices, default=JobStatus.QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField()
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # the workers' claim, runnable jobs in run_at order
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
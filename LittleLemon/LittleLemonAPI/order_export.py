@@ -0,0 +1,38 @@
+import heapq
+from itertools import groupby
+from operator import itemgetter
+from .models import OrderStatus
+from .streaming import json_record
+
+# one csv row per order line, the order columns repeat on every line of the order
+FIELDS = ['order_id', 'date', 'user', 'delivery_crew', 'status', 'total', 'menuitem', 'quantity', 'unit_price', 'price']
+ORDER_FIELDS = ['id', 'date', 'user', 'delivery_crew', 'status', 'total']
+ITEM_FIELDS = ['menuitem', 'quantity', 'unit_price', 'price']
+
+LOOKUPS = [
+    'id', 'date', 'user__username', 'delivery_crew__username', 'status', 'total',
+    'order_items__menuitem__title', 'order_items__quantity', 'order_items__unit_price', 'order_items__price',
+]
+
+def _rows(queryset, chunk_size):
+    rows = queryset.order_by('date', 'id', 'order_items__id').values_list(*LOOKUPS).iterator(chunk_size=chunk_size)
+    labels = dict(OrderStatus.choices)
+    return (row[:4] + (labels[row[4]],) + row[5:] for row in rows)
+
+def order_rows(querysets, chunk_size):
+    """
+    Lines of the given orders as tuples in FIELDS order, from a single LEFT JOIN
+    per queryset (hot orders, archived ones) read through a chunked iterator, so
+    memory stays flat whatever the number of rows. Ordered by (date, id), which
+    the date index serves without a sort, the querysets being merged as they are
+    read, and an order without lines yields one row with empty line columns.
+    """
+    return heapq.merge(*(_rows(queryset, chunk_size) for queryset in querysets), key=itemgetter(1, 0))
+
+def order_records(rows):
+    # rows of one order are consecutive, each group becomes one object with its lines nested
+    for _, lines in groupby(rows, key=itemgetter(0)):
+        lines = list(lines)
+        record = json_record(ORDER_FIELDS, lines[0][:6])
+        record['order_items'] = [json_record(ITEM_FIELDS, line[6:]) for line in lines if line[6] is not None]
+        yield record
@@ -0,0 +1,60 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from .conf import app_setting
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over the primary key, every page is a `id > cursor`
+    index range scan so page N costs the same as page 1 and no COUNT(*) is run.
+    Clients pick the page size with ?page_size= up to a server enforced maximum
+    and may ask for ?ordering=-id to walk newest first.
+    """
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    orderings = ('id', '-id')
+
+    def __init__(self):
+        self.max_page_size = app_setting('CURSOR_MAX_PAGE_SIZE')
+
+    def get_ordering(self, request, queryset, view):
+        # only unique keys make stable cursors, any other ?ordering falls back to id
+        ordering = request.query_params.get('ordering')
+        if ordering in self.orderings:
+            return (ordering,)
+        return (self.ordering,)
+
+class OptionalKeysetPagination(PageNumberPagination):
+    """
+    Page number pagination by default, keyset pagination when the client
+    opts in with ?pagination=cursor (the next/previous links carry ?cursor= and stay in keyset mode).
+    """
+    keyset_class = KeysetPagination
+
+    def __init__(self):
+        self.keyset = None
+
+    def keyset_requested(self, request):
+        return request.query_params.get('pagination') == 'cursor' or self.keyset_class.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.keyset_requested(request):
+            self.keyset = self.keyset_class()
+            page = self.keyset.paginate_queryset(queryset, request, view)
+            self.display_page_controls = self.keyset.display_page_controls
+            return page
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.keyset is not None:
+            return self.keyset.to_html()
+        return super().to_html()
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [
+            parameter for parameter in self.keyset_class().get_schema_operation_parameters(view)
+            if parameter['name'] != 'ordering'
+        ]
@@ -1,17 +1,22 @@
 from rest_framework import permissions
+from .roles import get_roles
 
 class IsUserManagerOrReadOnly(permissions.BasePermission):
     def has_permission(self, request, view):
         if request.method == 'GET':
             return True
-        if request.user.groups.filter(name='Manager').exists():
+        if get_roles(request.user).is_manager:
             return True
         else:
             return False
         
 class IsUserManager(permissions.BasePermission):
     def has_permission(self, request, view):
-        if request.user.groups.filter(name='Manager').exists():
+        if get_roles(request.user).is_manager:
             return True
         else:
-            return False
\ No newline at end of file
+            return False
+        
+class IsDeliveryCrew(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return get_roles(request.user).is_delivery_crew
@@ -0,0 +1,48 @@
+from rest_framework import renderers, parsers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils import encoders
+
+# orjson is optional, without it both classes behave exactly like the stock DRF ones
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # dates and dataclasses are handed back to DRF's encoder so their format matches the stdlib output
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer encoded with orjson when it is installed, producing the same bytes
+    as the stock one except for floats: exponents are written without sign and
+    padding (1e16, 1e-7 where the stdlib writes 1e+16, 1e-07, the same values) and
+    NaN / Infinity become null where the strict stock renderer raises. Indented
+    output (?indent / Accept: application/json; indent=4) and anything orjson
+    refuses, like integers wider than 64 bits, go through the stdlib path.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or orjson is None or not self.compact or self.ensure_ascii or not self.strict:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=encoders.JSONEncoder().default, option=ORJSON_OPTIONS)
+        except (orjson.JSONEncodeError, TypeError):
+            return super().render(data, accepted_media_type, renderer_context)
+        # same escaping as JSONRenderer, the two code points are valid JSON but not valid javascript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+class FastJSONParser(parsers.JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,128 @@
+from collections import namedtuple
+from django.contrib.auth.models import User, Group
+from django.core.cache import caches
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from django.dispatch import receiver
+from .caching import LRUCache
+from .conf import app_setting
+
+MANAGER = 'Manager'
+DELIVERY_CREW = 'Delivery Crew'
+
+class Roles(namedtuple('Roles', ['is_superuser', 'is_manager', 'is_delivery_crew'])):
+    @property
+    def can_manage(self):
+        # managers and admins share every order related privilege
+        return self.is_superuser or self.is_manager
+
+ANONYMOUS = Roles(False, False, False)
+
+_local_cache = LRUCache(app_setting('ROLE_CACHE_SIZE'), app_setting('ROLE_CACHE_TTL'))
+
+def _shared_cache():
+    alias = app_setting('ROLE_SHARED_CACHE')
+    return caches[alias] if alias else None
+
+def _cache_key(user_id):
+    return 'littlelemon:roles:%s' % user_id
+
+def _groups_query(user_id):
+    return User.groups.through.objects.filter(user_id=user_id, group__name__in=[MANAGER, DELIVERY_CREW]).values_list('group__name', flat=True)
+
+def _groups(names):
+    return (MANAGER in names, DELIVERY_CREW in names)
+
+def _load_groups(user_id):
+    # group membership is looked up at most once per user per TTL: in the shared cache when one
+    # is configured, only there so an invalidation by any worker applies to all of them at once,
+    # in the local LRU otherwise, then in the database
+    shared = _shared_cache()
+    if shared is not None:
+        groups = shared.get(_cache_key(user_id))
+        if groups is None:
+            groups = _groups(set(_groups_query(user_id)))
+            shared.set(_cache_key(user_id), groups, app_setting('ROLE_SHARED_CACHE_TTL'))
+        return groups
+
+    groups = _local_cache.get(user_id)
+    if groups is None:
+        groups = _groups(set(_groups_query(user_id)))
+        _local_cache.set(user_id, groups)
+    return groups
+
+async def _aload_groups(user_id):
+    # same lookups as _load_groups, without blocking the event loop on the shared cache or database
+    shared = _shared_cache()
+    if shared is not None:
+        groups = await shared.aget(_cache_key(user_id))
+        if groups is None:
+            groups = _groups({name async for name in _groups_query(user_id)})
+            await shared.aset(_cache_key(user_id), groups, app_setting('ROLE_SHARED_CACHE_TTL'))
+        return groups
+
+    groups = _local_cache.get(user_id)
+    if groups is None:
+        groups = _groups({name async for name in _groups_query(user_id)})
+        _local_cache.set(user_id, groups)
+    return groups
+
+# role group name -> id, filled on first use and dropped whenever a group is saved or deleted
+_group_ids = {}
+
+def group_id(name):
+    # membership writes need the group's id only, it is looked up once per process
+    pk = _group_ids.get(name)
+    if pk is None:
+        pk = _group_ids[name] = Group.objects.values_list('id', flat=True).get(name=name)
+    return pk
+
+def get_roles(user):
+    """
+    Roles of the given user, memoized on the user instance so every
+    permission and view check within one request shares a single lookup.
+    """
+    if user is None or not user.is_authenticated:
+        return ANONYMOUS
+    roles = getattr(user, '_littlelemon_roles', None)
+    if roles is None:
+        roles = Roles(user.is_superuser, *_load_groups(user.pk))
+        user._littlelemon_roles = roles
+    return roles
+
+async def aget_roles(user):
+    # async variant of get_roles, once it returns get_roles on the same instance is free
+    if user is None or not user.is_authenticated:
+        return ANONYMOUS
+    roles = getattr(user, '_littlelemon_roles', None)
+    if roles is None:
+        roles = Roles(user.is_superuser, *await _aload_groups(user.pk))
+        user._littlelemon_roles = roles
+    return roles
+
+def invalidate_roles(*users):
+    keys = []
+    for user in users:
+        user_id = getattr(user, 'pk', user)
+        _local_cache.delete(user_id)
+        keys.append(_cache_key(user_id))
+        if isinstance(user, User):
+            user.__dict__.pop('_littlelemon_roles', None)
+    shared = _shared_cache()
+    if shared is not None and keys:
+        shared.delete_many(keys)
+
+@receiver(m2m_changed, sender=User.groups.through)
+def _groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # catches membership changes made outside the API views, e.g. from the admin
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_roles(instance)
+    elif pk_set:
+        invalidate_roles(*pk_set)
+    else:
+        invalidate_roles(*instance.user_set.values_list('pk', flat=True))
+
+@receiver([post_save, post_delete], sender=Group)
+def _group_changed(sender, **kwargs):
+    _group_ids.clear()
@@ -0,0 +1,148 @@
+"""
+Menu search index behind ?search= on menu-items.
+
+On SQLite the menu is indexed in an FTS5 table, one row per menu item keyed by
+its id, with prefix indexes so 'lem' finds 'Lemonade', accents folded, and
+matches ranked with bm25 (title weighted over category title). Other databases
+use SearchFilter's LIKE scans until a backend for them is configured with the
+SEARCH_BACKEND setting.
+
+The index is updated in the same transaction as the menu writes, through the
+MenuItem/Category signals below and index_items for bulk writes, and can be
+rebuilt from scratch with `manage.py rebuild_menu_search`.
+"""
+import re
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.filters import SearchFilter
+from . import models
+from .conf import app_setting
+from .streaming import chunked
+
+TABLE = 'littlelemon_menu_search'
+
+# ids per statement, well under SQLite's limit on bound parameters
+BATCH_SIZE = 500
+
+# words of a search, anything else is dropped so user input never reaches the MATCH syntax
+WORD = re.compile(r'\w+')
+
+class SearchBackend:
+    def search(self, queryset, terms, request, view):
+        """
+        `queryset` narrowed to the menu items matching every term and annotated with
+        `search_rank`, lower is better. Ordered by rank unless already ordered.
+        """
+        raise NotImplementedError('.search() must be overridden')
+
+    def index_items(self, ids):
+        pass
+
+    def remove_items(self, ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+class LikeSearchBackend(SearchBackend):
+    # SearchFilter's icontains over the view's search_fields, no index to maintain
+    def search(self, queryset, terms, request, view):
+        return SearchFilter().filter_queryset(request, queryset, view)
+
+def fts5_available():
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return 'ENABLE_FTS5' in {row[0] for row in cursor.fetchall()}
+
+def create_fts5_table(cursor):
+    cursor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(title, category, prefix='2 3', tokenize='unicode61 remove_diacritics 2')" % TABLE
+    )
+    # rank is bm25 with a title match worth ten category matches
+    cursor.execute("INSERT INTO %s (%s, rank) VALUES ('rank', 'bm25(10.0, 1.0)')" % (TABLE, TABLE))
+
+class FTS5SearchBackend(SearchBackend):
+    def match_expression(self, terms):
+        # every word as a quoted prefix query, FTS5 ANDs them
+        words = [word for term in terms for word in WORD.findall(term)]
+        return ' '.join('"%s"*' % word for word in words)
+
+    def search(self, queryset, terms, request, view):
+        expression = self.match_expression(terms)
+        if not expression:
+            return queryset
+        item_id = '%s.%s' % (connection.ops.quote_name(models.MenuItem._meta.db_table), connection.ops.quote_name('id'))
+        queryset = queryset.filter(id__in=RawSQL('SELECT rowid FROM %s WHERE %s MATCH %%s' % (TABLE, TABLE), [expression]))
+        queryset = queryset.annotate(search_rank=RawSQL(
+            'SELECT rank FROM %s WHERE %s MATCH %%s AND rowid = %s' % (TABLE, TABLE, item_id), [expression],
+        ))
+        if not queryset.query.order_by:
+            queryset = queryset.order_by('search_rank', 'id')
+        return queryset
+
+    def index_items(self, ids):
+        with connection.cursor() as cursor:
+            for chunk in chunked(ids, BATCH_SIZE):
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute('DELETE FROM %s WHERE rowid IN (%s)' % (TABLE, placeholders), chunk)
+                cursor.execute(self._insert_sql('WHERE item.id IN (%s)' % placeholders), chunk)
+
+    def remove_items(self, ids):
+        with connection.cursor() as cursor:
+            for chunk in chunked(ids, BATCH_SIZE):
+                cursor.execute('DELETE FROM %s WHERE rowid IN (%s)' % (TABLE, ', '.join(['%s'] * len(chunk))), chunk)
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS %s' % TABLE)
+            create_fts5_table(cursor)
+            cursor.execute(self._insert_sql(''))
+
+    def _insert_sql(self, where):
+        qn = connection.ops.quote_name
+        return (
+            'INSERT INTO %s (rowid, title, category) SELECT item.id, item.title, category.title '
+            'FROM %s item JOIN %s category ON category.id = item.category_id %s'
+        ) % (TABLE, qn(models.MenuItem._meta.db_table), qn(models.Category._meta.db_table), where)
+
+_backend = None
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        path = app_setting('SEARCH_BACKEND')
+        if path:
+            _backend = import_string(path)()
+        else:
+            _backend = FTS5SearchBackend() if fts5_available() else LikeSearchBackend()
+    return _backend
+
+class MenuSearchFilter(SearchFilter):
+    # ?search= served by the configured search backend
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        return get_backend().search(queryset, terms, request, view)
+
+def index_items(ids):
+    get_backend().index_items(ids)
+
+@receiver(post_save, sender=models.MenuItem)
+def _menu_item_saved(sender, instance, **kwargs):
+    index_items([instance.id])
+
+@receiver(post_delete, sender=models.MenuItem)
+def _menu_item_deleted(sender, instance, **kwargs):
+    get_backend().remove_items([instance.id])
+
+@receiver(post_save, sender=models.Category)
+def _category_saved(sender, instance, created, **kwargs):
+    # the category title is indexed with every item of the category
+    if not created:
+        index_items(instance.menuitem_set.values_list('id', flat=True))
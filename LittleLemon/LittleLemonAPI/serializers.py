@@ -1,7 +1,25 @@
+import itertools
 from rest_framework import serializers
 from . import models
+from .conf import app_setting
+from .metrics import timed_serialization
 from django.contrib.auth.models import User, Group
 
+class OrderStatusField(serializers.Field):
+    # OrderStatus stored as a small int, read and written by its name
+    default_error_messages = {
+        'invalid': 'Unknown status "{input}", expected one of: {choices}.',
+    }
+    
+    def to_representation(self, value):
+        return models.OrderStatus(value).label
+    
+    def to_internal_value(self, data):
+        for value, label in models.OrderStatus.choices:
+            if data == label:
+                return models.OrderStatus(value)
+        self.fail('invalid', input=data, choices=', '.join(models.OrderStatus.labels))
+
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Category
@@ -15,11 +33,24 @@ class CategorySerializer(serializers.ModelSerializer):
         
 class MenuItemSerializer(serializers.ModelSerializer):
     category = serializers.StringRelatedField(read_only = True)
-    category_id = serializers.IntegerField(min_value=1, max_value=5)
+    category_id = serializers.IntegerField(min_value=1)
     class Meta:
         model = models.MenuItem
         fields = ['id', 'title', 'price', 'featured', 'category', 'category_id']
         
+    def validate_category_id(self, value):
+        if not models.Category.objects.filter(id=value).exists():
+            raise serializers.ValidationError("Category with id %d does not exist" % value)
+        return value
+        
+class MenuItemImportSerializer(serializers.Serializer):
+    # one row of a bulk menu import, rows with an id update that item, the others create one
+    id = serializers.IntegerField(min_value=1, required=False)
+    title = serializers.CharField(max_length=255)
+    price = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=0)
+    featured = serializers.BooleanField(default=False)
+    category = serializers.SlugField()
+        
 class ManagersSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -29,6 +60,32 @@ class ManagersSerializer(serializers.ModelSerializer):
             'email' : {'read_only': True},
         }
         
+class UserIdentifierField(serializers.Field):
+    # a user id (number) or username (string)
+    default_error_messages = {'invalid': 'Expected a user id or a username.'}
+
+    def to_internal_value(self, data):
+        if isinstance(data, int) and not isinstance(data, bool) and data > 0:
+            return data
+        if isinstance(data, str) and data.strip():
+            return data.strip()
+        self.fail('invalid')
+
+    def to_representation(self, value):
+        return value
+
+class GroupMembersSerializer(serializers.Serializer):
+    add = serializers.ListField(child=UserIdentifierField(), required=False, default=list)
+    remove = serializers.ListField(child=UserIdentifierField(), required=False, default=list)
+
+    def validate(self, data):
+        count = len(data['add']) + len(data['remove'])
+        if not count:
+            raise serializers.ValidationError('Give the users to add or remove')
+        if count > app_setting('GROUP_BULK_MAX_USERS'):
+            raise serializers.ValidationError('At most %d users per request' % app_setting('GROUP_BULK_MAX_USERS'))
+        return data
+
 class CartSerializer(serializers.ModelSerializer):
     menuitem = serializers.StringRelatedField(read_only=True)
     menuitem_id = serializers.IntegerField()
@@ -38,18 +95,24 @@ class CartSerializer(serializers.ModelSerializer):
         extra_kwargs = {
             'price' : {'read_only': True},
             'unit_price' : {'read_only': True},
+            'quantity' : {'min_value': 1},
         }
+
+    def validate_quantity(self, value):
+        if value > app_setting('CART_MAX_QUANTITY'):
+            raise serializers.ValidationError('Ensure this value is less than or equal to %d.' % app_setting('CART_MAX_QUANTITY'))
+        return value
     
 class OrderSerializer(serializers.ModelSerializer):
     order_items = serializers.StringRelatedField(many=True, read_only=True)
     user = serializers.StringRelatedField(read_only=True)
     delivery_crew = serializers.StringRelatedField(read_only=True)
+    status = OrderStatusField(read_only=True)
     class Meta():
         model = models.Order
         fields = ['id', 'user', 'order_items', 'total', 'status', 'delivery_crew', 'date']
         extra_kwargs = {
             'total' : {'read_only': True},
-            'status': {'read_only': True},
             'date': {'read_only': True},
         }
         
@@ -57,10 +120,102 @@ class SingleOrderSerializer(serializers.ModelSerializer):
     order_items = serializers.StringRelatedField(many=True, read_only=True)
     user = serializers.StringRelatedField(read_only=True)
     delivery_crew = serializers.CharField(allow_null=True, allow_blank=True, required=False)
+    status = OrderStatusField(required=False)
     class Meta():
         model = models.Order
         fields = ['id', 'user', 'order_items', 'total', 'status', 'delivery_crew', 'date']
         extra_kwargs = {
             'total' : {'read_only': True},
             'date' : {'read_only': True},
-        }   
\ No newline at end of file
+        }   
+
+class ValuesRepresentation:
+    """
+    Read only shortcut for list endpoints: rows are fetched with .values() and
+    rendered with the to_representation of the serializer's own fields, so the
+    output matches serializer_class(many=True).data without a model instance or
+    serializer being built per row.
+
+    `sources` maps a field name to the lookup it is read from when that is not
+    the field name itself, `many` maps a to-many field name to a function
+    returning a values_list queryset of (pk, value) pairs for a list of primary keys.
+    """
+    def __init__(self, serializer_class, sources=None, many=None):
+        self.serializer_class = serializer_class
+        self.sources = sources or {}
+        self.many = many or {}
+        self._fields = None
+
+    @property
+    def fields(self):
+        # compiled once per process: (field name, values() key, to_representation)
+        if self._fields is None:
+            self._fields = [
+                (field.field_name, self.sources.get(field.field_name, field.field_name), field.to_representation)
+                for field in self.serializer_class()._readable_fields
+            ]
+        return self._fields
+
+    def values(self, queryset):
+        # 'id' is always fetched, cursor pagination and the to-many lookups key on it
+        lookups = {'id'}
+        lookups.update(source for name, source, _ in self.fields if name not in self.many)
+        return queryset.prefetch_related(None).values(*sorted(lookups))
+
+    def to_representation(self, rows):
+        rows = list(rows)
+        related = {}
+        for name, pairs in self.many.items():
+            related[name] = _group(pairs([row['id'] for row in rows])) if rows else {}
+        return self._build(rows, related)
+
+    async def ato_representation(self, rows):
+        # rows is an already fetched list, the to-many lookups run through the async ORM
+        related = {}
+        for name, pairs in self.many.items():
+            related[name] = _group([pair async for pair in pairs([row['id'] for row in rows])]) if rows else {}
+        return self._build(rows, related)
+
+    def _build(self, rows, related):
+        with timed_serialization():
+            return self._build_rows(rows, related)
+
+    def _build_rows(self, rows, related):
+        data = []
+        for row in rows:
+            item = {}
+            for name, source, to_representation in self.fields:
+                value = related[name].get(row['id'], []) if name in related else row[source]
+                item[name] = None if value is None else to_representation(value)
+            data.append(item)
+        return data
+
+def _group(pairs):
+    grouped = {}
+    for key, value in pairs:
+        grouped.setdefault(key, []).append(value)
+    return grouped
+
+def order_item_titles(order_ids):
+    # (order id, OrderItem.__str__) of every line of the given orders, in line order
+    return models.OrderItem.objects.filter(order_id__in=order_ids).order_by('id').values_list('order_id', 'menuitem__title')
+
+def order_history_item_titles(order_ids):
+    # the same for a page mixing hot and archived orders, the lines of an order all live in its table
+    archived = models.ArchivedOrderItem.objects.filter(order_id__in=order_ids).order_by('id').values_list('order_id', 'menuitem__title')
+    return itertools.chain(order_item_titles(order_ids), archived)
+
+# StringRelatedField sources below read the same columns the related models' __str__ return
+category_representation = ValuesRepresentation(CategorySerializer)
+menu_item_representation = ValuesRepresentation(MenuItemSerializer, sources={'category': 'category__title'})
+cart_representation = ValuesRepresentation(CartSerializer, sources={'menuitem': 'menuitem__title'})
+order_representation = ValuesRepresentation(
+    OrderSerializer,
+    sources={'user': 'user__username', 'delivery_crew': 'delivery_crew__username'},
+    many={'order_items': order_item_titles},
+)
+order_history_representation = ValuesRepresentation(
+    OrderSerializer,
+    sources={'user': 'user__username', 'delivery_crew': 'delivery_crew__username'},
+    many={'order_items': order_history_item_titles},
+)
@@ -0,0 +1,153 @@
+"""
+Line based CSV / NDJSON bodies in both directions, without holding the whole
+file or table in memory: uploads are decoded and parsed one line at a time
+and exports are written from a queryset iterator into a StreamingHttpResponse.
+"""
+import codecs
+import csv
+import datetime
+import decimal
+import json
+from itertools import islice
+from django.http import StreamingHttpResponse
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+from .renderers import FastJSONRenderer
+
+CSV, NDJSON = 'csv', 'ndjson'
+
+CONTENT_TYPES = {
+    CSV: 'text/csv',
+    NDJSON: 'application/x-ndjson',
+}
+
+EXTENSIONS = {
+    '.csv': CSV,
+    '.ndjson': NDJSON,
+    '.jsonl': NDJSON,
+}
+
+class LineStreamParser(parsers.BaseParser):
+    # hands the raw request body to the view as a lazy iterator of lines instead of parsing it up front
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            return iter(())
+        return iter(stream.readline, b'')
+
+class CSVStreamParser(LineStreamParser):
+    media_type = CONTENT_TYPES[CSV]
+
+class NDJSONStreamParser(LineStreamParser):
+    media_type = CONTENT_TYPES[NDJSON]
+
+class StreamRenderer(renderers.BaseRenderer):
+    # makes text/csv and application/x-ndjson acceptable to content negotiation,
+    # exports are StreamingHttpResponses so only error bodies go through here, as JSON
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return FastJSONRenderer().render(data)
+
+class CSVRenderer(StreamRenderer):
+    media_type = CONTENT_TYPES[CSV]
+    format = CSV
+
+class NDJSONRenderer(StreamRenderer):
+    media_type = CONTENT_TYPES[NDJSON]
+    format = NDJSON
+
+def export_type(request):
+    # ?type=csv|ndjson, else what the Accept header asked for, else csv
+    accepted = getattr(request.accepted_renderer, 'format', None)
+    return request.query_params.get('type') or (accepted if accepted in CONTENT_TYPES else CSV)
+
+def upload_lines(request):
+    """
+    (format, lines) of the file sent as the 'file' field of a multipart form or as a
+    text/csv or application/x-ndjson body. ?type=csv|ndjson wins over the file name
+    extension and the content type.
+    """
+    upload = request.FILES.get('file')
+    if upload is not None:
+        kind = EXTENSIONS.get('.' + upload.name.rpartition('.')[2].lower())
+        lines = upload
+    elif isinstance(request.data, dict):
+        raise ParseError('Send the rows as a "file" upload or as a text/csv or application/x-ndjson body.')
+    else:
+        kind = NDJSON if request.content_type.startswith(CONTENT_TYPES[NDJSON]) else CSV
+        lines = request.data
+    kind = request.query_params.get('type', kind) or CSV
+    if kind not in CONTENT_TYPES:
+        raise ParseError('Unsupported type %s, expected csv or ndjson.' % kind)
+    return kind, codecs.iterdecode(lines, 'utf-8-sig')
+
+def iter_records(kind, lines):
+    """
+    (line number, dict or None) for every non blank record, None when the line can not be parsed.
+    """
+    if kind == NDJSON:
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield number, record if isinstance(record, dict) else None
+        return
+
+    reader = csv.DictReader(lines)
+    for record in reader:
+        # the header is line 1, quoted fields may span lines so the reader's count is used
+        yield reader.line_num, record
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+class _Echo:
+    # csv.writer target that returns the line instead of buffering it
+    def write(self, value):
+        return value
+
+def _csv_value(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return value
+
+def json_value(value):
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+def iter_csv(fields, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([_csv_value(value) for value in row])
+
+def iter_ndjson(records):
+    render = FastJSONRenderer().render
+    for record in records:
+        yield render(record) + b'\n'
+
+def json_record(fields, row):
+    return {field: json_value(value) for field, value in zip(fields, row)}
+
+def export_response(kind, fields, rows, filename, records=None):
+    """
+    StreamingHttpResponse writing `rows`, an iterable of tuples in `fields` order, as csv or ndjson.
+    `records`, an iterable of JSON ready dicts, replaces the flat rows in ndjson when given.
+    """
+    if kind not in CONTENT_TYPES:
+        raise ParseError('Unsupported type %s, expected csv or ndjson.' % kind)
+    if kind == CSV:
+        content = iter_csv(fields, rows)
+    else:
+        content = iter_ndjson(records if records is not None else (json_record(fields, row) for row in rows))
+    response = StreamingHttpResponse(content, content_type=CONTENT_TYPES[kind])
+    response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (filename, kind)
+    return response
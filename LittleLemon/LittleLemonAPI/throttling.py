@@ -0,0 +1,170 @@
+"""
+Fixed memory throttles shared by every worker.
+
+Each (bucket, client) pair keeps two counters, one for the current window and
+one for the previous, and the request rate is estimated as
+
+    previous * (time left of the previous window overlapping the sliding window) + current
+
+(the sliding window counter algorithm). A request costs one atomic increment in
+the store whatever the client's history, unlike DRF's throttles that keep and
+rewrite a list of timestamps per client. A rejected request takes its increment
+back, only allowed requests count, so a client retrying while throttled
+recovers once its window slides.
+
+Views pick their bucket with `throttle_scope`, a string or a {method: scope} dict.
+Rates are looked up as '<scope>.user' / '<scope>.anon' in DEFAULT_THROTTLE_RATES
+and fall back to the plain 'user' / 'anon' rates, so every scope gets its own
+bucket even when it has no rate of its own.
+"""
+import random
+import sqlite3
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+from .conf import app_setting
+
+class CacheThrottleStore:
+    """
+    Counters in a django cache, atomic and shared when the cache is (redis, memcached),
+    per process with the default local memory cache.
+    """
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def hit(self, key, previous_key, ttl):
+        self.cache.add(key, 0, ttl)
+        try:
+            current = self.cache.incr(key)
+        except ValueError:
+            # expired between add and incr
+            self.cache.add(key, 1, ttl)
+            current = 1
+        return current, self.cache.get(previous_key, 0)
+
+    def undo(self, key):
+        try:
+            self.cache.decr(key)
+        except ValueError:
+            # expired meanwhile, nothing to take back
+            pass
+
+class SQLiteThrottleStore:
+    """
+    Counters in a local SQLite file, the stand-in for a shared store when
+    several workers run on one host without redis or memcached.
+    """
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS throttle (key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires REAL NOT NULL)')
+            self._local.connection = connection
+        return connection
+
+    def hit(self, key, previous_key, ttl):
+        connection = self._connection()
+        now = time.time()
+        # one statement, the upsert is atomic across processes
+        current = connection.execute(
+            'INSERT INTO throttle (key, count, expires) VALUES (?, 1, ?) '
+            'ON CONFLICT (key) DO UPDATE SET count = count + 1 RETURNING count',
+            (key, now + ttl),
+        ).fetchone()[0]
+        row = connection.execute('SELECT count FROM throttle WHERE key = ? AND expires > ?', (previous_key, now)).fetchone()
+        if random.random() < 0.01:
+            connection.execute('DELETE FROM throttle WHERE expires < ?', (now,))
+        return current, row[0] if row else 0
+
+    def undo(self, key):
+        self._connection().execute('UPDATE throttle SET count = count - 1 WHERE key = ? AND count > 0', (key,))
+
+_stores = {}
+
+def get_store():
+    kind = app_setting('THROTTLE_STORE')
+    if kind not in _stores:
+        if kind == 'sqlite':
+            _stores[kind] = SQLiteThrottleStore(app_setting('THROTTLE_SQLITE_PATH') or settings.BASE_DIR / 'throttle.sqlite3')
+        else:
+            _stores[kind] = CacheThrottleStore(app_setting('THROTTLE_CACHE'))
+    return _stores[kind]
+
+class SlidingWindowThrottle(BaseThrottle):
+    # 'user' or 'anon', the suffix of the rate looked up for the view's scope
+    scope = None
+
+    def get_bucket(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if isinstance(scope, dict):
+            scope = scope.get(request.method)
+        return scope or 'default'
+
+    def get_rate(self, bucket):
+        rates = api_settings.DEFAULT_THROTTLE_RATES
+        rate = rates.get('%s.%s' % (bucket, self.scope), rates.get(self.scope))
+        if rate is None:
+            return None
+        num, period = rate.split('/')
+        return int(num), {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+
+    def get_ident_key(self, request):
+        raise NotImplementedError('.get_ident_key() must be overridden')
+
+    def allow_request(self, request, view):
+        ident = self.get_ident_key(request)
+        if ident is None:
+            return True
+        bucket = self.get_bucket(request, view)
+        rate = self.get_rate(bucket)
+        if rate is None:
+            return True
+
+        self.num_requests, self.duration = rate
+        now = time.time()
+        window = int(now // self.duration)
+        self.elapsed = now - window * self.duration
+        key = 'throttle:%s:%s:%s:%%d' % (self.scope, bucket, ident)
+        store = get_store()
+        self.current, self.previous = store.hit(key % window, key % (window - 1), 2 * self.duration)
+        estimate = self.previous * (1 - self.elapsed / self.duration) + self.current
+        if estimate <= self.num_requests:
+            return True
+        # atomic increment then compensation, rather than a read before a separate write that concurrent requests could both pass
+        store.undo(key % window)
+        self.current -= 1
+        return False
+
+    def wait(self):
+        # current counts the allowed requests only, the one being retried comes on top
+        if self.current >= self.num_requests:
+            # nothing left in this window, the next one starts with this window as its previous
+            return self.duration - self.elapsed + self.duration * (1 - (self.num_requests - 1) / max(self.current, 1))
+        # previous window's weight has to fall enough to make room for one more request
+        needed = self.duration * (1 - (self.num_requests - self.current - 1) / self.previous)
+        return max(needed - self.elapsed, 0)
+
+class UserThrottle(SlidingWindowThrottle):
+    scope = 'user'
+
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return None
+
+class AnonThrottle(SlidingWindowThrottle):
+    scope = 'anon'
+
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.get_ident(request)
@@ -1,5 +1,7 @@
 from django.urls import path
 from . import views
+from .roles import MANAGER, DELIVERY_CREW
+from . import async_views
 
 from rest_framework.authtoken.views import obtain_auth_token
 
@@ -9,14 +11,34 @@ urlpatterns = [
     path('category-list', views.CategoryItemsView.as_view()),
     path('menu-items', views.MenuItemsView.as_view()),
     path('menu-items/<int:pk>', views.SingleMenuItemView.as_view()),
+    path('menu-items/import', views.MenuItemsImportView.as_view()),
+    path('menu-items/export', views.MenuItemsExportView.as_view()),
     
     path('groups/manager/users', views.ManagersView.as_view()),
     path('groups/manager/users/<int:pk>', views.SingleManagersView.as_view()),
+    path('groups/manager/users/bulk', views.GroupMembersBulkView.as_view(group=MANAGER)),
     path('groups/delivery-crew/users', views.DeliveryCrewView.as_view()),
     path('groups/delivery-crew/users/<int:pk>', views.SingleDeliveryCrewView.as_view()),
+    path('groups/delivery-crew/users/bulk', views.GroupMembersBulkView.as_view(group=DELIVERY_CREW)),
     
     path('cart/menu-items', views.CartItemsView.as_view()),
+    path('cart/menu-items/<int:menuitem_id>', views.SingleCartItemView.as_view()),
     
     path('orders', views.OrdersView.as_view()),
     path('orders/<int:pk>', views.SingleOrderItemsView.as_view()),
+    path('orders/export', views.OrdersExportView.as_view()),
+    path('orders/dispatch', views.DispatchQueueView.as_view()),
+    path('orders/dispatch/claim', views.ClaimOrderView.as_view()),
+    path('orders/events', views.OrderEventsView.as_view()),
+    
+    path('reports/sales', views.SalesReportView.as_view()),
+    path('reports/menu-items', views.MenuItemsReportView.as_view()),
+    path('reports/categories', views.CategoriesReportView.as_view()),
+    path('reports/delivery-crew', views.DeliveryCrewReportView.as_view()),
+    
+    # ASGI-native read endpoints, same responses as their sync counterparts above
+    path('async/category-list', async_views.AsyncCategoryItemsView.as_view()),
+    path('async/menu-items', async_views.AsyncMenuItemsView.as_view()),
+    path('async/cart/menu-items', async_views.AsyncCartItemsView.as_view()),
+    path('async/orders', async_views.AsyncOrdersView.as_view()),
 ]
\ No newline at end of file
@@ -1,28 +1,79 @@
 from . import models
 from . import serializers
-import decimal
-from .permissions import IsUserManagerOrReadOnly, IsUserManager
+from . import checkout
+from . import cart
+from . import streaming
+from .menu_import import import_menu
+from . import order_export
+from . import analytics
+from . import archive
+from . import dispatch
+from . import events
+from . import membership
+from .idempotency import idempotent
+from .search import MenuSearchFilter
+from .conf import app_setting
+from .renderers import FastJSONRenderer
+import logging
+from .permissions import IsUserManagerOrReadOnly, IsUserManager, IsDeliveryCrew
+from .roles import get_roles, group_id, invalidate_roles, MANAGER, DELIVERY_CREW
+from .catalogue import CatalogueCacheMixin
+from .database import ReplicaReadMixin
+from .pagination import OptionalKeysetPagination
+from .filters import OrderFilter
+from .throttling import UserThrottle, AnonThrottle
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
-from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
-from django.contrib.auth.models import User, Group
+from rest_framework.parsers import MultiPartParser
+from rest_framework.filters import OrderingFilter
+from django_filters.rest_framework import DjangoFilterBackend
+from django.contrib.auth.models import User
 from django.shortcuts import get_object_or_404
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import F, Sum
+from decimal import Decimal
+from collections import Counter
 
-class CategoryItemsView(generics.ListCreateAPIView):
-    throttle_classes = [UserRateThrottle, AnonRateThrottle]
+logger = logging.getLogger(__name__)
+
+CENTS = Decimal('0.01')
+
+class ValuesListMixin:
+    # list GETs rendered through serializers.ValuesRepresentation instead of a serializer per row
+    list_representation = None
+    
+    def list_rows(self):
+        return self.list_representation.values(self.filter_queryset(self.get_queryset()))
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.list_rows()
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.list_representation.to_representation(page))
+        return Response(self.list_representation.to_representation(queryset))
+
+class CategoryItemsView(CatalogueCacheMixin, ReplicaReadMixin, ValuesListMixin, generics.ListCreateAPIView):
+    throttle_classes = [UserThrottle, AnonThrottle]
+    throttle_scope = 'menu'
     permission_classes = [IsAuthenticated, IsUserManagerOrReadOnly | IsAdminUser]
     queryset = models.Category.objects.all()
     serializer_class = serializers.CategorySerializer
+    list_representation = serializers.category_representation
     ordering_fields = ['title']
     search_fields = ['title']
 
-class MenuItemsView(generics.ListCreateAPIView):
-    throttle_classes = [UserRateThrottle, AnonRateThrottle]
+class MenuItemsView(CatalogueCacheMixin, ReplicaReadMixin, ValuesListMixin, generics.ListCreateAPIView):
+    throttle_classes = [UserThrottle, AnonThrottle]
+    throttle_scope = 'menu'
     permission_classes = [IsAuthenticated, IsUserManagerOrReadOnly | IsAdminUser]
     serializer_class = serializers.MenuItemSerializer
+    list_representation = serializers.menu_item_representation
+    pagination_class = OptionalKeysetPagination
+    filter_backends = [DjangoFilterBackend, OrderingFilter, MenuSearchFilter]
     ordering_fields = ['price']
+    # ?search= is served by the menu search index, these are used where no index is available
     search_fields = ['title', 'category__title']
     
     def get_queryset(self):
@@ -34,13 +85,45 @@ class MenuItemsView(generics.ListCreateAPIView):
         
     
 class SingleMenuItemView(generics.RetrieveUpdateDestroyAPIView):
-    throttle_classes = [UserRateThrottle, AnonRateThrottle]
+    throttle_classes = [UserThrottle, AnonThrottle]
+    throttle_scope = 'menu'
     permission_classes = [IsAuthenticated, IsUserManagerOrReadOnly | IsAdminUser]
     queryset = models.MenuItem.objects.select_related('category').all()
     serializer_class = serializers.MenuItemSerializer
 
+class MenuItemsImportView(generics.GenericAPIView):
+    throttle_classes = [UserThrottle, AnonThrottle]
+    throttle_scope = 'menu'
+    permission_classes = [IsAuthenticated, IsUserManager | IsAdminUser]
+    parser_classes = [MultiPartParser, streaming.CSVStreamParser, streaming.NDJSONStreamParser]
+    
+    # columns: id (optional, updates that item), title, price, featured, category (slug)
+    def post(self, request, *args, **kwargs):
+        kind, lines = streaming.upload_lines(request)
+        result = import_menu(streaming.iter_records(kind, lines))
+        return Response({
+            "message": "%d items created, %d items updated, %d rows rejected" % (result.created, result.updated, result.error_count),
+            "created": result.created,
+            "updated": result.updated,
+            "error_count": result.error_count,
+            "errors": result.errors,
+        }, status=status.HTTP_200_OK)
+    
+class MenuItemsExportView(generics.GenericAPIView):
+    throttle_classes = [UserThrottle, AnonThrottle]
+    throttle_scope = 'menu'
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, streaming.CSVRenderer, streaming.NDJSONRenderer]
+    fields = ['id', 'title', 'price', 'featured', 'category']
+    
+    # same columns as the import, ?type=csv|ndjson
+    def get(self, request, *args, **kwargs):
+        rows = models.MenuItem.objects.order_by('id').values_list('id', 'title', 'price', 'featured', 'category__slug')
+        return streaming.export_response(streaming.export_type(request), self.fields, rows.iterator(chunk_size=app_setting('EXPORT_CHUNK_SIZE')), 'menu-items')
+
 class ManagersView(generics.ListCreateAPIView):
-    throttle_classes = [UserRateThrottle, AnonRateThrottle]
+    throttle_classes = [UserThrottle, AnonThrottle]
+    throttle_scope = 'groups'
     permission_classes = [IsAuthenticated, IsUserManager | IsAdminUser]
     queryset = User.objects.filter(groups__name = 'Manager').all().order_by('id')
     serializer_class = serializers.ManagersSerializer
@@ -55,17 +138,19 @@ class ManagersView(generics.ListCreateAPIView):
             except User.DoesNotExist:
                 return Response({"message": username + " does not exist in the user list"}, status=status.HTTP_404_NOT_FOUND)
             
-            if user.groups.filter(name = 'Manager').exists():
+            if get_roles(user).is_manager:
                 return Response({"message": "User is already a manager"}, status=status.HTTP_400_BAD_REQUEST)
             else:
-                Group.objects.get(name='Manager').user_set.add(user)
+                user.groups.add(group_id(MANAGER))
+                invalidate_roles(user)
                 return Response({"message": username + " is now a manager"}, status=status.HTTP_200_OK)
         else:
             return Response({"message": "A valid username is required"}, status=status.HTTP_400_BAD_REQUEST)
         
     
 class SingleManagersView(generics.RetrieveDestroyAPIView):
-    throttle_classes = [UserRateThrottle, AnonRateThrottle]
+    throttle_classes = [UserThrottle, AnonThrottle]
+    throttle_scope = 'groups'
     permission_classes = [IsAuthenticated, IsUserManager | IsAdminUser]
     queryset = User.objects.filter(groups__name = 'Manager').all().order_by('id')
     serializer_class = serializers.ManagersSerializer
@@ -74,11 +159,13 @@ class SingleManagersView(generics.RetrieveDestroyAPIView):
         # not overriding this method completely erases user data instead of only removing the user from manager role
         pk = kwargs['pk']
         user = get_object_or_404(User, id=pk)
-        Group.objects.get(name='Manager').user_set.remove(user)
+        user.groups.remove(group_id(MANAGER))
+        invalidate_roles(user)
         return Response({"message": user.username + " is removed from Managers group"}, status=status.HTTP_200_OK)
     
 class DeliveryCrewView(generics.ListCreateAPIView):
-    throttle_classes = [UserRateThrottle, AnonRateThrottle]
+    throttle_classes = [UserThrottle, AnonThrottle]
+    throttle_scope = 'groups'
     permission_classes = [IsAuthenticated, IsUserManager | IsAdminUser]
     queryset = User.objects.filter(groups__name = 'Delivery Crew').all().order_by('id')
     ordering_fields = ['username']
@@ -95,16 +182,18 @@ class DeliveryCrewView(generics.ListCreateAPIView):
             except User.DoesNotExist:
                 return Response({"message": username + " does not exist in the user list"}, status=status.HTTP_404_NOT_FOUND)
             
-            if user.groups.filter(name = 'Delivery Crew').exists():
+            if get_roles(user).is_delivery_crew:
                 return Response({"message": "User is already in the delivery crew"}, status=status.HTTP_400_BAD_REQUEST)
             else:
-                Group.objects.get(name='Delivery Crew').user_set.add(user)
+                user.groups.add(group_id(DELIVERY_CREW))
+                invalidate_roles(user)
                 return Response({"message": username + " is now in the delivery crew"}, status=status.HTTP_200_OK)
         else:
             return Response({"message": "A valid username is required"}, status=status.HTTP_400_BAD_REQUEST)
 
 class SingleDeliveryCrewView(generics.RetrieveDestroyAPIView):
-    throttle_classes = [UserRateThrottle, AnonRateThrottle]
+    throttle_classes = [UserThrottle, AnonThrottle]
+    throttle_scope = 'groups'
     permission_classes = [IsAuthenticated, IsUserManager | IsAdminUser]
     queryset = User.objects.filter(groups__name = 'Delivery Crew').all().order_by('id')
     serializer_class = serializers.ManagersSerializer
@@ -113,186 +202,278 @@ class SingleDeliveryCrewView(generics.RetrieveDestroyAPIView):
         # not overriding this method completely erases user data instead of only removing the user from manager role
         pk = kwargs['pk']
         user = get_object_or_404(User, id=pk)
-        Group.objects.get(name='Delivery Crew').user_set.remove(user)
+        user.groups.remove(group_id(DELIVERY_CREW))
+        invalidate_roles(user)
         return Response({"message": user.username + " is removed from the delivery crew"}, status=status.HTTP_200_OK)
     
-class CartItemsView(generics.ListCreateAPIView, generics.DestroyAPIView):
-    throttle_classes = [UserRateThrottle, AnonRateThrottle]
+class GroupMembersBulkView(generics.GenericAPIView):
+    throttle_classes = [UserThrottle, AnonThrottle]
+    throttle_scope = 'groups'
+    permission_classes = [IsAuthenticated, IsUserManager | IsAdminUser]
+    serializer_class = serializers.GroupMembersSerializer
+    # name of the group, set in urls.py
+    group = None
+    
+    # {"add": [...], "remove": [...]}, users by id or username, answered with one result per user
+    def post(self, request, *args, **kwargs):
+        serialized_members = self.get_serializer(data=request.data)
+        serialized_members.is_valid(raise_exception=True)
+        try:
+            results = membership.update_members(self.group, **serialized_members.validated_data)
+        except ValueError as error:
+            return Response({"message": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        counts = Counter(result['result'] for result in results)
+        return Response({
+            "message": "%d users added to and %d removed from %s" % (counts[membership.ADDED], counts[membership.REMOVED], self.group),
+            "results": results,
+        }, status=status.HTTP_200_OK)
+    
+class CartItemsView(ValuesListMixin, generics.ListCreateAPIView, generics.DestroyAPIView):
+    throttle_classes = [UserThrottle, AnonThrottle]
+    throttle_scope = 'cart'
     permission_classes = [IsAuthenticated]
     serializer_class = serializers.CartSerializer
+    list_representation = serializers.cart_representation
+    pagination_class = OptionalKeysetPagination
     ordering_fields = ['menuitem__title', 'price']
     search_fields = ['menuitem__title']
     
     def get_queryset(self):
         if self.request.user.is_authenticated:
-            return models.Cart.objects.select_related('menuitem').filter(user = self.request.user).order_by('id')
+            return models.Cart.objects.select_related('user', 'menuitem').filter(user = self.request.user).order_by('id')
         return None
     
+    # a single item {"menuitem_id", "quantity"} or a batch {"items": [...]}, items already
+    # in the cart have their quantity increased, the whole request is one upsert statement
+    @idempotent
     def post(self, request, *args, **kwargs):
-        serialized_item = serializers.CartSerializer(data = request.data)
-        serialized_item.is_valid(raise_exception=True)
-        menuitem_id = request.data['menuitem_id']
-        quantity = request.data['quantity']
-        
-        try:
-            menuitem = models.MenuItem.objects.get(id=menuitem_id)
-        except models.MenuItem.DoesNotExist:
-            return Response({"message": "item with id:" + menuitem_id + " does not exist in the menu-items list"}, status=status.HTTP_404_NOT_FOUND)
+        many = 'items' in request.data
+        # the batch is one statement, its length is capped below the database's bound parameter limit
+        extra = {'max_length': app_setting('CART_BATCH_MAX_ITEMS')} if many else {}
+        serialized_items = serializers.CartSerializer(data = request.data['items'] if many else request.data, many=many, **extra)
+        serialized_items.is_valid(raise_exception=True)
+        items = serialized_items.validated_data if many else [serialized_items.validated_data]
         
-        price = int(quantity) * menuitem.price
-
         try:
-            models.Cart.objects.create(user=request.user, menuitem=menuitem, quantity=quantity, unit_price=menuitem.price, price=price)
-        except:
-            return Response({"message": "Item already exists in the cart"}, status=status.HTTP_400_BAD_REQUEST)
+            result = cart.add_items(request.user, [(item['menuitem_id'], item['quantity']) for item in items])
+        except cart.CartLimitExceeded as exceeded:
+            return Response({"message": "At most %d of an item fit in the cart" % app_setting('CART_MAX_QUANTITY'), "over_limit": exceeded.menuitem_ids}, status=status.HTTP_400_BAD_REQUEST)
         
+        if many:
+            return Response({"message": "%d items added to cart successfully" % len(result.added), "added": result.added, "missing": result.missing}, status=status.HTTP_200_OK)
+        if result.missing:
+            return Response({"message": "item with id:" + str(result.missing[0]) + " does not exist in the menu-items list"}, status=status.HTTP_404_NOT_FOUND)
         return Response({"message": "Item added to cart successfully"}, status=status.HTTP_200_OK)
     
     def delete(self, request, *args, **kwargs):
         models.Cart.objects.filter(user = request.user).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
     
-class OrdersView(generics.ListCreateAPIView):
-    throttle_classes = [UserRateThrottle, AnonRateThrottle]
+class SingleCartItemView(generics.GenericAPIView):
+    throttle_classes = [UserThrottle, AnonThrottle]
+    throttle_scope = 'cart'
+    permission_classes = [IsAuthenticated]
+    serializer_class = serializers.CartSerializer
+    
+    # sets the quantity of one cart line, the price follows in the same UPDATE
+    def patch(self, request, *args, **kwargs):
+        serialized_item = serializers.CartSerializer(data = {'menuitem_id': kwargs['menuitem_id'], 'quantity': request.data.get('quantity')})
+        serialized_item.is_valid(raise_exception=True)
+        if not cart.set_quantity(request.user, kwargs['menuitem_id'], serialized_item.validated_data['quantity']):
+            return Response({"message": "Item is not in the cart"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"message": "Cart updated successfully"}, status=status.HTTP_200_OK)
+    
+    def delete(self, request, *args, **kwargs):
+        if not cart.remove_item(request.user, kwargs['menuitem_id']):
+            return Response({"message": "Item is not in the cart"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    
+class OrdersView(ValuesListMixin, generics.ListCreateAPIView):
+    throttle_classes = [UserThrottle, AnonThrottle]
+    throttle_scope = {'GET': 'orders', 'POST': 'checkout'}
     permission_classes = [IsAuthenticated]
     serializer_class = serializers.OrderSerializer
+    list_representation = serializers.order_representation
+    pagination_class = OptionalKeysetPagination
     ordering_fields = ['delivery_crew__username', 'status', 'total', 'user__username']
+    filterset_class = OrderFilter
     search_fields = ['user__username', 'delivery_crew__username', 'order_items']
     
     def get_queryset(self):
-        user = self.request.user
-        queryset = models.Order.objects.prefetch_related('order_items').all().order_by('id')
-        if user.is_superuser or user.groups.filter(name = 'Manager').exists():
-            return queryset
-        elif user.groups.filter(name = 'Delivery Crew').exists():
-            return queryset.filter(user = user) | queryset.filter(delivery_crew=user)
-        return queryset.filter(user=user)
+        return models.Order.objects.visible_to(self.request.user).with_details().order_by('id')
     
+    # managers reaching back into archived orders read both tables, in the order the filters gave the hot one
+    def list_rows(self):
+        rows = super().list_rows()
+        if not (get_roles(self.request.user).can_manage and archive.reaches_archive(self.request.query_params)):
+            return rows
+        self.list_representation = serializers.order_history_representation
+        archived = self.list_representation.values(self.filter_queryset(models.ArchivedOrder.objects.all()))
+        return archive.OrderHistory([rows, archived], rows.query.order_by)
     
+    # retried checkouts with the same Idempotency-Key get the first response instead of a second order
+    @idempotent
     def post(self, request, *args, **kwargs):
-        cart_items = models.Cart.objects.select_related('menuitem').filter(user = request.user).all()
-        if not cart_items:
+        result = checkout.place_order(request.user)
+        if result.order is None:
             return Response({"message": "Your cart is empty, please add something to place an order"}, status = status.HTTP_400_BAD_REQUEST)
-        
-        newOrder = models.Order.objects.create(user=request.user, total=0)
-        totalOverall = decimal.Decimal(0)
-        for item in cart_items:
-            models.OrderItem.objects.create(order=newOrder, menuitem=item.menuitem, quantity=item.quantity, unit_price=item.unit_price, price=item.price)
-            totalOverall += item.price
-        cart_items.delete()
-        newOrder.total = totalOverall
-        newOrder.save()
+        logger.debug("order %s placed with %d statements", result.order.id, result.statements)
         
         return Response({"message": "Order Successfully created"}, status=status.HTTP_201_CREATED)
     
+class OrdersExportView(generics.GenericAPIView):
+    throttle_classes = [UserThrottle, AnonThrottle]
+    throttle_scope = 'orders'
+    permission_classes = [IsAuthenticated, IsUserManager | IsAdminUser]
+    renderer_classes = [FastJSONRenderer, streaming.CSVRenderer, streaming.NDJSONRenderer]
+    queryset = models.Order.objects.all()
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = OrderFilter
+    
+    # every order with its lines, ?type=csv|ndjson, filtered with ?status= and ?date__gte= / ?date__lte=
+    # archived orders are merged in when the range reaches them
+    def get(self, request, *args, **kwargs):
+        querysets = [self.filter_queryset(self.get_queryset())]
+        if archive.reaches_archive(request.query_params):
+            querysets.append(self.filter_queryset(models.ArchivedOrder.objects.all()))
+        rows = order_export.order_rows(querysets, app_setting('EXPORT_CHUNK_SIZE'))
+        return streaming.export_response(streaming.export_type(request), order_export.FIELDS, rows, 'orders', records=order_export.order_records(rows))
+    
 class SingleOrderItemsView(generics.RetrieveUpdateDestroyAPIView):
-    throttle_classes = [UserRateThrottle, AnonRateThrottle]
+    throttle_classes = [UserThrottle, AnonThrottle]
+    throttle_scope = 'orders'
     permission_classes = [IsAuthenticated]
     serializer_class = serializers.SingleOrderSerializer
     
     def get_queryset(self):
-        user = self.request.user
-        queryset = models.Order.objects.prefetch_related('order_items').all()
-        if user.is_superuser or user.groups.filter(name = 'Manager').exists():
-            return queryset
-        elif user.groups.filter(name = 'Delivery Crew').exists():
-            return queryset.filter(user = user) | queryset.filter(delivery_crew=user)
-        return queryset.filter(user=user)
+        return models.Order.objects.visible_to(self.request.user).with_details()
     
     # In put and patch methods,
     # manager can update 'delivery_crew', 'status'
     # delivery crew can update 'status'
     # normal customer can not update any field in the order
-    def put(self, request, *args, **kwargs):
-        serialized_item = serializers.SingleOrderSerializer(data = request.data)
-        serialized_item.is_valid(raise_exception=True)
-        
-        user = request.user
-        original_order = get_object_or_404(models.Order, id=kwargs['pk'])
-        
-        isManager = True if user.groups.filter(name='Manager').exists() or user.is_superuser else False
-        isDeliveryCrew = True if user.groups.filter(name='Delivery Crew').exists() and original_order.delivery_crew == user else False
-        if not isManager and not isDeliveryCrew:
-            return Response({"message": "You do not have permission to change order details"}, status=status.HTTP_401_UNAUTHORIZED)
-
-        order_status = request.POST.get('status')
-        delivery_crew_username = request.POST.get('delivery_crew')
-        try:
-            order_status = order_status or request.data['status']
-        except:
-            pass
-        try:
-            delivery_crew_username = delivery_crew_username or request.data['delivery_crew']
-        except:
-            pass
-                
-        if isManager:
-            if delivery_crew_username:
-                delivery_crew_user = get_object_or_404(User, username=delivery_crew_username)
-                if not delivery_crew_user.groups.filter(name = 'Delivery Crew').exists():
-                    return Response({"message": delivery_crew_username + " is not part of the delivery crew"}, status=status.HTTP_400_BAD_REQUEST)
-                original_order.delivery_crew = delivery_crew_user
-            else:
-                original_order.delivery_crew = None
-        elif delivery_crew_username:
-            return Response({"message": "You can not change delivery crew"}, status=status.HTTP_401_UNAUTHORIZED)
-        
-        if str(order_status).lower() == 'true':
-            original_order.status = True
-        else:
-            original_order.status = False
-    
-        original_order.save()
-        return Response({"message": "order updated successfully"}, status=status.HTTP_200_OK)
-            
-    def patch(self, request, *args, **kwargs):
-        serialized_item = serializers.SingleOrderSerializer(data = request.data)
+    # fields that are not sent are left as they are, see dispatch.update_order for the status lifecycle
+    def update(self, request, *args, **kwargs):
+        serialized_item = serializers.SingleOrderSerializer(data = request.data, partial=True)
         serialized_item.is_valid(raise_exception=True)
         
-        user = request.user
-        original_order = get_object_or_404(models.Order, id=kwargs['pk'])
-        
-        isManager = True if user.groups.filter(name='Manager').exists() or user.is_superuser else False
-        isDeliveryCrew = True if user.groups.filter(name='Delivery Crew').exists() and original_order.delivery_crew == user else False
-        if not isManager and not isDeliveryCrew:
-            return Response({"message": "You do not have permission to change order details"}, status=status.HTTP_401_UNAUTHORIZED)
-
-        order_status = request.POST.get('status')
-        delivery_crew_username = request.POST.get('delivery_crew')
-        try:
-            order_status = order_status or request.data['status']
-        except:
-            pass
         try:
-            delivery_crew_username = delivery_crew_username or request.data['delivery_crew']
-        except:
-            pass
-                
-        if isManager:
-            if delivery_crew_username:
-                delivery_crew_user = get_object_or_404(User, username=delivery_crew_username)
-                if not delivery_crew_user.groups.filter(name = 'Delivery Crew').exists():
-                    return Response({"message": delivery_crew_username + " is not part of the delivery crew"}, status=status.HTTP_400_BAD_REQUEST)
-                original_order.delivery_crew = delivery_crew_user
-            else:
-                original_order.delivery_crew = None
-        elif delivery_crew_username:
-            return Response({"message": "You can not change delivery crew"}, status=status.HTTP_401_UNAUTHORIZED)
-        
-        if str(order_status).lower() == 'true':
-            original_order.status = True
-        else:
-            original_order.status = False
-    
-        original_order.save()
+            dispatch.update_order(kwargs['pk'], request.user, serialized_item.validated_data)
+        except dispatch.OrderUpdateRejected as rejected:
+            return Response({"message": rejected.message}, status=rejected.status_code)
         return Response({"message": "order updated successfully"}, status=status.HTTP_200_OK)
     
     # only manager can perform the delete action
     def destroy(self, request, *args, **kwargs):
-        if request.user.is_superuser or request.user.groups.filter(name = 'Manager').exists():
+        if get_roles(request.user).can_manage:
             return super().destroy(request, *args, **kwargs)
         return Response({"message": "Only manager or admin can delete an order"}, status=status.HTTP_401_UNAUTHORIZED)
 
+class DispatchQueueView(ValuesListMixin, generics.ListAPIView):
+    # placed orders waiting for a delivery crew, oldest first
+    throttle_classes = [UserThrottle, AnonThrottle]
+    throttle_scope = 'dispatch'
+    permission_classes = [IsAuthenticated, IsDeliveryCrew | IsUserManager | IsAdminUser]
+    serializer_class = serializers.OrderSerializer
+    list_representation = serializers.order_representation
+    pagination_class = OptionalKeysetPagination
+    filter_backends = []
+    
+    def get_queryset(self):
+        return dispatch.waiting_orders().with_details()
+    
+class ClaimOrderView(generics.GenericAPIView):
+    throttle_classes = [UserThrottle, AnonThrottle]
+    throttle_scope = 'dispatch'
+    permission_classes = [IsAuthenticated, IsDeliveryCrew]
+    serializer_class = serializers.OrderSerializer
+    
+    # the oldest placed order is assigned to the crew member asking, no two claims get the same order
+    def post(self, request, *args, **kwargs):
+        order = dispatch.claim_next(request.user)
+        if order is None:
+            return Response({"message": "No orders are waiting for a delivery crew"}, status=status.HTTP_404_NOT_FOUND)
+        order = models.Order.objects.with_details().get(id=order.id)
+        return Response(serializers.OrderSerializer(order).data, status=status.HTTP_200_OK)
+    
+class OrderEventsView(generics.GenericAPIView):
+    # Server-Sent Events about the user's orders, every order for managers;
+    # a reconnecting client gets what it missed through the Last-Event-ID header (or ?last_event_id=)
+    throttle_classes = [UserThrottle, AnonThrottle]
+    throttle_scope = 'events'
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, events.EventStreamRenderer]
+    
+    def get(self, request, *args, **kwargs):
+        last_event_id = request.headers.get('Last-Event-ID', request.query_params.get('last_event_id'))
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            return Response({"message": "Last-Event-ID must be an event id"}, status=status.HTTP_400_BAD_REQUEST)
+        return events.event_response(request.user, last_event_id, asynchronous=isinstance(request._request, ASGIRequest))
+    
+class ReportView(generics.GenericAPIView):
+    # manager reports read only the daily rollup tables maintained by analytics.py,
+    # their cost follows the number of days asked for (?date__gte= / ?date__lte=), not the order history
+    throttle_classes = [UserThrottle, AnonThrottle]
+    throttle_scope = 'reports'
+    permission_classes = [IsAuthenticated, IsUserManager | IsAdminUser]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = {'date': ['exact', 'gte', 'lte']}
+    pagination_class = None
+    # summed rollup fields, the first one ranks the groups
+    fields = []
+    # {output name: lookup} the rows are grouped by, the report lists one row per day when empty
+    group_by = {}
+    max_limit = 100
+    
+    def get(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.group_by:
+            try:
+                limit = min(int(request.query_params.get('limit', 10)), self.max_limit)
+            except ValueError:
+                return Response({"message": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+            if limit < 1:
+                return Response({"message": "limit must be at least 1"}, status=status.HTTP_400_BAD_REQUEST)
+            # over every group of the range, not only the ranked ones
+            totals = analytics.queryset_totals(queryset, self.fields)
+            queryset = queryset.values(
+                *[lookup for name, lookup in self.group_by.items() if name == lookup],
+                **{name: F(lookup) for name, lookup in self.group_by.items() if name != lookup},
+            )
+            rows = list(queryset.annotate(**{field: Sum(field) for field in self.fields}).order_by('-' + self.fields[0])[:limit])
+        else:
+            rows = list(queryset.order_by('date').values('date', *self.fields))
+            totals = analytics.totals(rows, self.fields)
+        return Response({
+            "results": [self.to_representation(row) for row in rows],
+            "totals": self.to_representation(totals),
+        })
+    
+    def to_representation(self, row):
+        # sums of decimal columns come back from SQLite without their scale
+        return {name: streaming.json_value(value.quantize(CENTS) if isinstance(value, Decimal) else value) for name, value in row.items()}
+    
+class SalesReportView(ReportView):
+    queryset = models.DailySales.objects.all()
+    fields = ['order_count', 'items_sold', 'revenue']
+    
+class MenuItemsReportView(ReportView):
+    queryset = models.DailyMenuItemSales.objects.all()
+    fields = ['quantity', 'revenue']
+    group_by = {'menuitem_id': 'menuitem_id', 'title': 'menuitem__title'}
+    
+class CategoriesReportView(ReportView):
+    queryset = models.DailyCategorySales.objects.all()
+    fields = ['quantity', 'revenue']
+    group_by = {'category_id': 'category_id', 'title': 'category__title'}
+    
+class DeliveryCrewReportView(ReportView):
+    queryset = models.DailyDeliveryCrewOrders.objects.all()
+    fields = ['order_count', 'delivered_count']
+    group_by = {'delivery_crew_id': 'delivery_crew_id', 'username': 'delivery_crew__username'}
+
 
 
 
@@ -371,4 +552,4 @@ class SingleOrderItemsView(generics.RetrieveUpdateDestroyAPIView):
 #         newOrder.total = totalOverall
 #         newOrder.save()
         
-#         return Response({"message": "Order Successfully created"}, status=status.HTTP_201_CREATED)
\ No newline at end of file
+#         return Response({"message": "Order Successfully created"}, status=status.HTTP_201_CREATED)
@@ -0,0 +1,71 @@
+"""
+Load generator comparing the sync (WSGI) and async (ASGI) read endpoints.
+
+Start the two servers against the same database, for example
+
+    gunicorn LittleLemon.wsgi -w 1 --threads 8 -b 127.0.0.1:8000
+    uvicorn LittleLemon.asgi:application --workers 1 --port 8001
+
+and run
+
+    python -m benchmarks.async_load --token <token> --concurrency 1 8 32 64 \
+        --target wsgi=http://127.0.0.1:8000/api/orders \
+        --target asgi=http://127.0.0.1:8001/api/async/orders
+
+Each concurrency level runs for --duration seconds per target and prints
+throughput and latency percentiles, showing how each path scales.
+"""
+import argparse
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from .utils import percentile
+
+def run(url, token, concurrency, duration):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client():
+        headers = {'Authorization': 'Token ' + token} if token else {}
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as response:
+                    response.read()
+            except (urllib.error.URLError, ConnectionError) as exc:
+                with lock:
+                    errors.append(exc)
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--target', action='append', required=True, help='name=url')
+    parser.add_argument('--token', default='')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 64])
+    parser.add_argument('--duration', type=float, default=10.0)
+    args = parser.parse_args()
+
+    print('%-8s %6s %10s %10s %10s %7s' % ('target', 'conc', 'req/s', 'p50 ms', 'p99 ms', 'errors'))
+    for concurrency in args.concurrency:
+        for target in args.target:
+            name, url = target.split('=', 1)
+            latencies, errors = run(url, args.token, concurrency, args.duration)
+            print('%-8s %6d %10.1f %10.1f %10.1f %7d' % (
+                name, concurrency, len(latencies) / args.duration,
+                percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000, len(errors),
+            ))
+
+if __name__ == '__main__':
+    main()
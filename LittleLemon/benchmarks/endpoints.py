@@ -0,0 +1,120 @@
+"""
+Latency, queries and memory of every API route against a synthetic dataset, with baselines.
+
+    python -m benchmarks.endpoints [--scale small|medium|large] [--iterations 20] [--workers 4]
+        [--only menu] [--save results.json] [--baseline results.json] [--threshold 0.25]
+
+The dataset (see benchmarks.scenarios) is built in a throwaway database. Every
+scenario runs through the Django test client and, with --workers, over HTTP
+against that many forked server processes. --save writes the results as JSON,
+--baseline compares with the results of an earlier run at the same scale and
+exits with status 1 when a metric regressed past --threshold.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from .utils import setup_django, test_database
+
+# metric: absolute slack added to the relative threshold, keeps timer noise on sub-millisecond routes from failing a run
+TRACKED = {
+    'p50_ms': 1.0,
+    'p99_ms': 2.0,
+    'memory_kb': 16.0,
+}
+
+# throttles stay in the request path, with rates no benchmark reaches
+UNLIMITED = {'anon': '100000000/s', 'user': '100000000/s'}
+
+def compare(results, baseline, threshold):
+    """
+    Regressions of `results` against `baseline` (same layout) as (scenario, metric, baseline, current)
+    tuples: a timing or memory metric regresses when it grows past baseline * (1 + threshold)
+    plus its slack, the query count as soon as it grows at all.
+    Scenarios missing from either side are not compared.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric, slack in TRACKED.items():
+            if metric in current and metric in previous and current[metric] > previous[metric] * (1 + threshold) + slack:
+                regressions.append((name, metric, previous[metric], current[metric]))
+        if 'queries' in current and 'queries' in previous and current['queries'] > previous['queries']:
+            regressions.append((name, 'queries', previous['queries'], current['queries']))
+    return regressions
+
+def report(name, result):
+    details = ', '.join('%s %s' % (key, value) for key, value in result.items() if key not in ('route', 'status'))
+    errors = [status for status in result['status'] if status >= 400]
+    print('  %-30s %s%s' % (name, details, '  status %s' % result['status'] if errors else ''))
+
+def run_benchmarks(args):
+    from django.conf import settings
+    from django.test.utils import override_settings
+    from . import scenarios
+
+    selected = [scenario for scenario in scenarios.SCENARIOS if not args.only or args.only in scenario.name]
+    scale = scenarios.SCALES[args.scale]
+    results = {'scale': args.scale, 'iterations': args.iterations, 'modes': {}}
+    with override_settings(
+        REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': UNLIMITED},
+        LITTLELEMON={
+            **getattr(settings, 'LITTLELEMON', {}), 'METRICS_TOKEN': scenarios.METRICS_TOKEN,
+            'METRICS_SLOW_REQUEST_MS': None, 'EVENTS_STREAM_TIMEOUT': 0,
+        },
+    ):
+        print('building the %s dataset: %d orders, %d menu items, %d customers' % ((args.scale,) + tuple(scale)))
+        dataset = scenarios.build_dataset(scale)
+        print('test client')
+        results['modes']['client'] = scenarios.run(scenarios.ClientDriver(dataset), selected, args.iterations, report)
+        if not args.only:
+            covered = {result['route'] for result in results['modes']['client'].values()}
+            missing = sorted(route for route in scenarios.url_routes() if route.startswith('api/') and route not in covered)
+            if missing:
+                print('routes without a scenario: %s' % ', '.join(missing))
+        if args.workers:
+            print('server with %d workers' % args.workers)
+            driver = scenarios.ServerDriver(dataset, args.workers)
+            try:
+                results['modes']['server'] = scenarios.run(driver, selected, args.iterations, report)
+            finally:
+                driver.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', choices=['small', 'medium', 'large'], default='small')
+    parser.add_argument('--iterations', type=int, default=20, help='timed requests per scenario')
+    parser.add_argument('--workers', type=int, default=0, help='also run against a local server with this many worker processes')
+    parser.add_argument('--only', default=None, help='run the scenarios whose name contains this text')
+    parser.add_argument('--save', default=None)
+    parser.add_argument('--baseline', default=None)
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative growth of a metric over the baseline')
+    args = parser.parse_args()
+
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    if baseline is not None and baseline['scale'] != args.scale:
+        sys.exit('the baseline was recorded at the %s scale' % baseline['scale'])
+
+    setup_django()
+    with test_database():
+        results = run_benchmarks(args)
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, indent=2, sort_keys=True) + '\n')
+        print('results written to %s' % args.save)
+    if baseline is not None:
+        regressions = []
+        for mode, mode_results in results['modes'].items():
+            regressions += [(mode,) + regression for regression in compare(mode_results, baseline['modes'].get(mode, {}), args.threshold)]
+        for mode, name, metric, previous, current in regressions:
+            print('REGRESSION %s %s: %s went from %s to %s' % (mode, name, metric, previous, current))
+        if regressions:
+            sys.exit(1)
+        print('no regression against %s' % args.baseline)
+
+if __name__ == '__main__':
+    main()
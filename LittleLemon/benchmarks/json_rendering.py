@@ -0,0 +1,54 @@
+"""
+Compares the stock JSONRenderer with FastJSONRenderer on a page of 1k orders.
+
+    python -m benchmarks.json_rendering [--orders 1000] [--repeat 5]
+"""
+import argparse
+import datetime
+from collections import OrderedDict
+from decimal import Decimal
+
+from .utils import setup_django, best_of
+
+def order_page(count):
+    # shaped like a paginated OrderSerializer response, plus raw Decimal/date values for the encoder fallback
+    return OrderedDict([
+        ('count', count),
+        ('next', 'http://testserver/api/orders?page=2'),
+        ('previous', None),
+        ('results', [
+            OrderedDict([
+                ('id', index),
+                ('user', 'customer%d' % index),
+                ('order_items', ['Dish %d' % item for item in range(5)]),
+                ('total', '%d.50' % (index % 900)),
+                ('status', index % 2 == 0),
+                ('delivery_crew', 'crew%d' % (index % 7) if index % 3 else None),
+                ('date', datetime.date(2024, 1, 1) + datetime.timedelta(days=index % 365)),
+                ('unit_prices', [Decimal('2.50'), Decimal('11.25')]),
+            ])
+            for index in range(count)
+        ]),
+    ])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework.renderers import JSONRenderer
+    from LittleLemonAPI import renderers
+
+    data = order_page(args.orders)
+    stock, fast = JSONRenderer(), renderers.FastJSONRenderer()
+    assert stock.render(data) == fast.render(data), 'renderers disagree'
+
+    print('orjson installed: %s' % (renderers.orjson is not None))
+    results = [(name, best_of(lambda: renderer.render(data), args.repeat, 10)) for name, renderer in (('JSONRenderer', stock), ('FastJSONRenderer', fast))]
+    for name, seconds in results:
+        print('%-18s %8.2f ms/page  %5.1fx' % (name, seconds * 1000, results[0][1] / seconds))
+
+if __name__ == '__main__':
+    main()
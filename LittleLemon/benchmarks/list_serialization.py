@@ -0,0 +1,67 @@
+"""
+Rows per second of the list endpoints' representation, ModelSerializer vs ValuesRepresentation.
+
+    python -m benchmarks.list_serialization [--rows 1000] [--repeat 5]
+"""
+import argparse
+from decimal import Decimal
+
+from .utils import setup_django, best_of, test_database
+
+def populate(rows):
+    from django.contrib.auth.models import User
+    from LittleLemonAPI import models
+
+    customer = User.objects.create_user('customer')
+    crew = User.objects.create_user('crew')
+    category = models.Category.objects.create(slug='mains', title='Mains')
+    menu_items = models.MenuItem.objects.bulk_create([
+        models.MenuItem(title='Dish %d' % index, price=Decimal('2.50') + index % 50, featured=index % 5 == 0, category=category)
+        for index in range(rows)
+    ])
+    models.Cart.objects.bulk_create([
+        models.Cart(user=customer, menuitem=menuitem, quantity=2, unit_price=menuitem.price, price=2 * menuitem.price)
+        for menuitem in menu_items
+    ])
+    orders = models.Order.objects.bulk_create([
+        models.Order(user=customer, delivery_crew=crew if index % 2 else None, total=Decimal('12.50'))
+        for index in range(rows)
+    ])
+    models.OrderItem.objects.bulk_create([
+        models.OrderItem(order=order, menuitem=menu_items[(index + offset) % rows], quantity=1, unit_price=Decimal('2.50'), price=Decimal('2.50'))
+        for index, order in enumerate(orders) for offset in range(3)
+    ])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework.renderers import JSONRenderer
+    from LittleLemonAPI import models, serializers
+
+    endpoints = [
+        ('menu-items', serializers.MenuItemSerializer, serializers.menu_item_representation, lambda: models.MenuItem.objects.select_related('category')),
+        ('cart/menu-items', serializers.CartSerializer, serializers.cart_representation, lambda: models.Cart.objects.select_related('user', 'menuitem')),
+        ('orders', serializers.OrderSerializer, serializers.order_representation, lambda: models.Order.objects.with_details()),
+    ]
+    with test_database():
+        populate(args.rows)
+        print('%-16s %14s %14s %8s' % ('endpoint', 'serializer', 'values', 'speedup'))
+        for name, serializer_class, representation, queryset in endpoints:
+            def serializer_path():
+                return serializer_class(queryset().order_by('id'), many=True).data
+
+            def values_path():
+                return representation.to_representation(representation.values(queryset().order_by('id')))
+
+            renderer = JSONRenderer()
+            assert renderer.render(serializer_path()) == renderer.render(values_path()), name + ' output differs'
+            before = args.rows / best_of(serializer_path, args.repeat)
+            after = args.rows / best_of(values_path, args.repeat)
+            print('%-16s %10.0f r/s %10.0f r/s %7.1fx' % (name, before, after, after / before))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,390 @@
+"""
+Datasets, scenarios and drivers of benchmarks.endpoints, imported once Django is set up.
+
+build_dataset fills an empty database with synthetic data at one of SCALES:
+role-assigned users with tokens, categories and menu items, orders with their
+lines spread over the last year, the sales rollups and the search index.
+SCENARIOS then send requests to every route, either in process through the
+Django test client (ClientDriver: latency, median queries per request and
+allocated memory) or over HTTP to forked workers of a local WSGI server sharing one
+listening socket (ServerDriver: latency under concurrency).
+
+Results are {scenario name: metrics}.
+"""
+import datetime
+import http.client
+import json
+import os
+import random
+import signal
+import socket
+import statistics
+import time
+import tracemalloc
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from urllib.parse import urlencode
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User, Group
+from django.core.cache import caches
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.servers.basehttp import WSGIServer, WSGIRequestHandler
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver
+from rest_framework.authtoken.models import Token
+from LittleLemonAPI import analytics
+from LittleLemonAPI import models
+from LittleLemonAPI import search
+from LittleLemonAPI.conf import app_setting
+from LittleLemonAPI.models import OrderStatus
+from LittleLemonAPI.roles import MANAGER, DELIVERY_CREW
+from .utils import percentile
+
+Scale = namedtuple('Scale', ['orders', 'menu_items', 'customers'])
+
+SCALES = {
+    'small': Scale(orders=1000, menu_items=10, customers=100),
+    'medium': Scale(orders=100000, menu_items=1000, customers=1000),
+    'large': Scale(orders=1000000, menu_items=10000, customers=10000),
+}
+
+PASSWORD = 'benchmark'
+
+# bearer token /metrics is scraped with, set as METRICS_TOKEN for the run
+METRICS_TOKEN = 'benchmark'
+
+# rows per bulk insert while building the dataset
+BATCH_SIZE = 5000
+
+Dataset = namedtuple('Dataset', ['scale', 'users', 'auth', 'menu_item_ids', 'category', 'crew', 'customer_order_id'])
+
+Request = namedtuple('Request', ['method', 'path', 'body', 'content_type'])
+
+# serial scenarios change state shared by all their requests (the one customer's cart),
+# the server run sends them one at a time instead of concurrently
+Scenario = namedtuple('Scenario', ['name', 'role', 'prepare', 'serial'], defaults=[False])
+
+def build_dataset(scale, seed=0):
+    """
+    Fill the current database, which must be empty, with a dataset of the given Scale.
+    Every customer gets about the same number of orders, 1% of them (at least 10)
+    are still placed and the others are delivered by one of the crew members.
+    """
+    rng = random.Random(seed)
+    manager_group, _ = Group.objects.get_or_create(name=MANAGER)
+    crew_group, _ = Group.objects.get_or_create(name=DELIVERY_CREW)
+
+    # hashed once, every user shares the password
+    password = make_password(PASSWORD)
+    roles = {
+        'manager': User(username='bench-manager', password=password),
+        'crew': User(username='bench-crew', password=password),
+        'customer': User(username='bench-customer', password=password),
+        'staff': User(username='bench-staff', password=password, is_staff=True),
+    }
+    User.objects.bulk_create(roles.values())
+    crew = [roles['crew']] + User.objects.bulk_create(
+        User(username='bench-crew-%d' % i, password=password) for i in range(max(scale.customers // 50, 1))
+    )
+    customers = [roles['customer']] + User.objects.bulk_create(
+        (User(username='bench-customer-%d' % i, password=password) for i in range(scale.customers - 1)), batch_size=BATCH_SIZE,
+    )
+    User.groups.through.objects.bulk_create(
+        [User.groups.through(user_id=roles['manager'].id, group_id=manager_group.id)]
+        + [User.groups.through(user_id=user.id, group_id=crew_group.id) for user in crew]
+    )
+    auth = {}
+    for role, user in roles.items():
+        token = Token.objects.create(user=user)
+        auth[role] = 'Token %s' % token.key
+    auth['metrics'] = 'Bearer %s' % METRICS_TOKEN
+
+    categories = models.Category.objects.bulk_create(
+        models.Category(slug='category-%d' % i, title='Category %d' % i) for i in range(min(scale.menu_items, 10))
+    )
+    menu_items = models.MenuItem.objects.bulk_create((
+        models.MenuItem(
+            title='Dish %d %s' % (i, rng.choice(['soup', 'salad', 'pasta', 'fish', 'cake'])),
+            price=Decimal(rng.randrange(250, 3000)) / 100, featured=i % 10 == 0, category=categories[i % len(categories)],
+        ) for i in range(scale.menu_items)
+    ), batch_size=BATCH_SIZE)
+
+    today = datetime.date.today()
+    placed = max(scale.orders // 100, 10)
+    for start in range(0, scale.orders, BATCH_SIZE):
+        orders, lines = [], []
+        for i in range(start, min(start + BATCH_SIZE, scale.orders)):
+            items = [(item, rng.randint(1, 3)) for item in rng.sample(menu_items, 2)]
+            is_placed = i >= scale.orders - placed
+            orders.append(models.Order(
+                user=customers[i % len(customers)], delivery_crew=None if is_placed else rng.choice(crew),
+                status=OrderStatus.PLACED if is_placed else OrderStatus.DELIVERED,
+                total=sum(item.price * quantity for item, quantity in items),
+                date=today - datetime.timedelta(days=365 * (scale.orders - i) // scale.orders),
+            ))
+            lines.append(items)
+        models.Order.objects.bulk_create(orders)
+        models.OrderItem.objects.bulk_create(
+            models.OrderItem(order=order, menuitem=item, quantity=quantity, unit_price=item.price, price=item.price * quantity)
+            for order, items in zip(orders, lines) for item, quantity in items
+        )
+
+    # bulk inserts send no signals, the derived tables are built from scratch
+    analytics.rebuild()
+    search.get_backend().rebuild()
+    caches[app_setting('CATALOGUE_CACHE')].clear()
+    customer_order_id = models.Order.objects.filter(user=roles['customer']).values_list('id', flat=True).first()
+    return Dataset(scale, roles, auth, [item.id for item in menu_items], categories[0], crew[0], customer_order_id)
+
+def _get(path):
+    return Request('GET', path, None, None)
+
+def _json(method, path, data):
+    return Request(method, path, json.dumps(data).encode(), 'application/json')
+
+def _form(method, path, data):
+    return Request(method, path, urlencode(data).encode(), 'application/x-www-form-urlencoded')
+
+def _fill_cart(dataset, count=3):
+    rows = models.MenuItem.objects.filter(id__in=dataset.menu_item_ids[:count]).values_list('id', 'price')
+    models.Cart.objects.bulk_create([
+        models.Cart(user=dataset.users['customer'], menuitem_id=menuitem_id, quantity=2, unit_price=price, price=2 * price)
+        for menuitem_id, price in rows
+    ], ignore_conflicts=True)
+
+def _placed_order(dataset):
+    return models.Order.objects.create(user=dataset.users['customer'], total=Decimal('10.00'))
+
+def _new_menu_item(dataset, i):
+    return models.MenuItem.objects.create(title='Bench dish %d' % i, price=Decimal('9.50'), featured=False, category=dataset.category)
+
+def _group_member(group, i):
+    user = User.objects.create(username='bench-member-%s-%d-%d' % (group[0], i, time.monotonic_ns()))
+    user.groups.add(Group.objects.get(name=group))
+    return user
+
+def _new_users(prefix, i, count=20):
+    users = User.objects.bulk_create(User(username='bench-%s-%d-%d-%d' % (prefix, i, n, time.monotonic_ns())) for n in range(count))
+    return [user.username for user in users]
+
+def _since(days):
+    return (datetime.date.today() - datetime.timedelta(days=days)).isoformat()
+
+def _import_body(i):
+    lines = (json.dumps({'title': 'Imported %d-%d' % (i, n), 'price': '7.25', 'featured': False, 'category': 'category-0'}) for n in range(20))
+    return Request('POST', '/api/menu-items/import', '\n'.join(lines).encode(), 'application/x-ndjson')
+
+# one entry per (route, method, role) worth timing; prepare(dataset, iteration) sets up
+# whatever the request needs, outside of the measurement, and returns it
+SCENARIOS = [
+    Scenario('token login', 'anon', lambda d, i: _form('POST', '/api/api-token-auth', {'username': 'bench-customer', 'password': PASSWORD})),
+
+    Scenario('categories list', 'customer', lambda d, i: _get('/api/category-list')),
+    Scenario('categories create', 'manager', lambda d, i: _json('POST', '/api/category-list', {'slug': 'bench-%d-%d' % (i, time.monotonic_ns()), 'title': 'Bench'})),
+    Scenario('menu list', 'customer', lambda d, i: _get('/api/menu-items')),
+    Scenario('menu list page 2', 'customer', lambda d, i: _get('/api/menu-items?page=2&ordering=price')),
+    Scenario('menu search', 'customer', lambda d, i: _get('/api/menu-items?search=pasta')),
+    Scenario('menu list cursor', 'customer', lambda d, i: _get('/api/menu-items?pagination=cursor&page_size=50')),
+    Scenario('menu create', 'manager', lambda d, i: _json('POST', '/api/menu-items', {'title': 'Bench %d' % i, 'price': '8.00', 'featured': False, 'category_id': d.category.id})),
+    Scenario('menu item', 'customer', lambda d, i: _get('/api/menu-items/%d' % d.menu_item_ids[i % len(d.menu_item_ids)])),
+    Scenario('menu item update', 'manager', lambda d, i: _json('PATCH', '/api/menu-items/%d' % d.menu_item_ids[0], {'price': '%d.50' % (5 + i % 10)})),
+    Scenario('menu item delete', 'manager', lambda d, i: Request('DELETE', '/api/menu-items/%d' % _new_menu_item(d, i).id, None, None)),
+    Scenario('menu import', 'manager', lambda d, i: _import_body(i)),
+    Scenario('menu export', 'customer', lambda d, i: _get('/api/menu-items/export?type=ndjson')),
+
+    Scenario('managers list', 'manager', lambda d, i: _get('/api/groups/manager/users')),
+    Scenario('managers add', 'manager', lambda d, i: _form('POST', '/api/groups/manager/users', {'username': User.objects.create(username='bench-new-m-%d-%d' % (i, time.monotonic_ns())).username})),
+    Scenario('manager detail', 'manager', lambda d, i: _get('/api/groups/manager/users/%d' % d.users['manager'].id)),
+    Scenario('managers remove', 'manager', lambda d, i: Request('DELETE', '/api/groups/manager/users/%d' % _group_member(MANAGER, i).id, None, None)),
+    Scenario('managers bulk add', 'manager', lambda d, i: _json('POST', '/api/groups/manager/users/bulk', {'add': _new_users('bulk-m', i)})),
+    Scenario('crew list', 'manager', lambda d, i: _get('/api/groups/delivery-crew/users')),
+    Scenario('crew add', 'manager', lambda d, i: _form('POST', '/api/groups/delivery-crew/users', {'username': User.objects.create(username='bench-new-c-%d-%d' % (i, time.monotonic_ns())).username})),
+    Scenario('crew detail', 'manager', lambda d, i: _get('/api/groups/delivery-crew/users/%d' % d.crew.id)),
+    Scenario('crew remove', 'manager', lambda d, i: Request('DELETE', '/api/groups/delivery-crew/users/%d' % _group_member(DELIVERY_CREW, i).id, None, None)),
+    Scenario('crew bulk add', 'manager', lambda d, i: _json('POST', '/api/groups/delivery-crew/users/bulk', {'add': _new_users('bulk-c', i)})),
+
+    Scenario('cart list', 'customer', lambda d, i: (_fill_cart(d), _get('/api/cart/menu-items'))[1]),
+    Scenario('cart add', 'customer', lambda d, i: _json('POST', '/api/cart/menu-items', {'menuitem_id': d.menu_item_ids[i % len(d.menu_item_ids)], 'quantity': 1})),
+    Scenario('cart line update', 'customer', lambda d, i: (_fill_cart(d), _json('PATCH', '/api/cart/menu-items/%d' % d.menu_item_ids[0], {'quantity': 1 + i % 5}))[1], serial=True),
+    Scenario('cart line remove', 'customer', lambda d, i: (_fill_cart(d), Request('DELETE', '/api/cart/menu-items/%d' % d.menu_item_ids[0], None, None))[1], serial=True),
+    Scenario('cart clear', 'customer', lambda d, i: (_fill_cart(d), Request('DELETE', '/api/cart/menu-items', None, None))[1], serial=True),
+
+    Scenario('orders list customer', 'customer', lambda d, i: _get('/api/orders')),
+    Scenario('orders list crew', 'crew', lambda d, i: _get('/api/orders')),
+    Scenario('orders list manager', 'manager', lambda d, i: _get('/api/orders')),
+    Scenario('orders list manager filtered', 'manager', lambda d, i: _get('/api/orders?status=delivered&date__gte=%s' % _since(30))),
+    Scenario('checkout', 'customer', lambda d, i: (_fill_cart(d), Request('POST', '/api/orders', None, None))[1], serial=True),
+    Scenario('order detail', 'customer', lambda d, i: _get('/api/orders/%d' % d.customer_order_id)),
+    Scenario('order assign', 'manager', lambda d, i: _json('PATCH', '/api/orders/%d' % _placed_order(d).id, {'delivery_crew': d.crew.username})),
+    Scenario('order delete', 'manager', lambda d, i: Request('DELETE', '/api/orders/%d' % _placed_order(d).id, None, None)),
+    Scenario('orders export', 'manager', lambda d, i: _get('/api/orders/export?type=ndjson&date__gte=%s' % _since(7))),
+    Scenario('dispatch queue', 'crew', lambda d, i: _get('/api/orders/dispatch')),
+    Scenario('dispatch claim', 'crew', lambda d, i: (_placed_order(d), Request('POST', '/api/orders/dispatch/claim', None, None))[1]),
+    Scenario('order events', 'customer', lambda d, i: _get('/api/orders/events')),
+
+    Scenario('sales report', 'manager', lambda d, i: _get('/api/reports/sales?date__gte=%s' % _since(30))),
+    Scenario('menu items report', 'manager', lambda d, i: _get('/api/reports/menu-items?date__gte=%s' % _since(30))),
+    Scenario('categories report', 'manager', lambda d, i: _get('/api/reports/categories?date__gte=%s' % _since(30))),
+    Scenario('delivery crew report', 'manager', lambda d, i: _get('/api/reports/delivery-crew?date__gte=%s' % _since(30))),
+
+    Scenario('async categories list', 'customer', lambda d, i: _get('/api/async/category-list')),
+    Scenario('async menu list', 'customer', lambda d, i: _get('/api/async/menu-items')),
+    Scenario('async cart list', 'customer', lambda d, i: (_fill_cart(d), _get('/api/async/cart/menu-items'))[1]),
+    Scenario('async orders list', 'customer', lambda d, i: _get('/api/async/orders')),
+
+    Scenario('metrics', 'metrics', lambda d, i: _get('/metrics')),
+]
+
+def url_routes(resolver=None, prefix=''):
+    # every route of the url configuration, in the format of resolver_match.route
+    for pattern in (resolver or get_resolver()).url_patterns:
+        if isinstance(pattern, URLResolver):
+            yield from url_routes(pattern, prefix + str(pattern.pattern))
+        elif isinstance(pattern, URLPattern):
+            yield prefix + str(pattern.pattern)
+
+def _summary(latencies):
+    return {'p50_ms': round(percentile(latencies, 0.5) * 1000, 3), 'p99_ms': round(percentile(latencies, 0.99) * 1000, 3)}
+
+class ClientDriver:
+    """
+    Requests through the Django test client, in this process. Queries are counted with
+    CaptureQueriesContext and memory is the peak traced by
+    tracemalloc during a request, measured in a separate pass so tracing does not
+    slow down the timed one.
+    """
+    memory_iterations = 3
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.client = Client()
+
+    def send(self, scenario, request):
+        headers = {}
+        if scenario.role in self.dataset.auth:
+            headers['HTTP_AUTHORIZATION'] = self.dataset.auth[scenario.role]
+        response = self.client.generic(request.method, request.path, request.body or b'', request.content_type or 'application/octet-stream', **headers)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def run(self, scenario, iterations):
+        # one untimed request first, so caches are warm as they are in production
+        response = self.send(scenario, scenario.prepare(self.dataset, 0))
+        route = response.resolver_match.route if response.resolver_match else None
+        latencies, queries, statuses = [], [], set()
+        for i in range(1, iterations + 1):
+            request = scenario.prepare(self.dataset, i)
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = self.send(scenario, request)
+                latencies.append(time.perf_counter() - start)
+            queries.append(len(captured))
+            statuses.add(response.status_code)
+
+        peak = 0
+        tracemalloc.start()
+        try:
+            for i in range(iterations + 1, iterations + 1 + self.memory_iterations):
+                request = scenario.prepare(self.dataset, i)
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                self.send(scenario, request)
+                peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+        finally:
+            tracemalloc.stop()
+        return {
+            **_summary(latencies), 'queries': statistics.median_low(queries), 'memory_kb': round(peak / 1024, 1),
+            'route': route, 'status': sorted(statuses),
+        }
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+def _serve(listener, port):
+    # runs in a forked worker, until the parent terminates it
+    try:
+        server = WSGIServer(('127.0.0.1', port), _QuietHandler, bind_and_activate=False)
+        server.socket.close()
+        server.socket = listener
+        server.server_name, server.server_port = '127.0.0.1', port
+        server.setup_environ()
+        server.set_app(WSGIHandler())
+        server.serve_forever()
+    finally:
+        os._exit(0)
+
+class ServerDriver:
+    """
+    Requests over HTTP to `workers` forked processes accepting on one listening socket,
+    the layout of a pre-forking server such as gunicorn, sent by as many concurrent
+    clients as there are workers, one for serial scenarios. Only latency is measured, queries and memory are in
+    the workers.
+    """
+    def __init__(self, dataset, workers):
+        self.dataset = dataset
+        self.workers = workers
+        self.listener = socket.create_server(('127.0.0.1', 0), backlog=128)
+        self.port = self.listener.getsockname()[1]
+        # children must open their own database connections
+        connections.close_all()
+        self.pids = []
+        for _ in range(workers):
+            pid = os.fork()
+            if pid == 0:
+                _serve(self.listener, self.port)
+            self.pids.append(pid)
+
+    def close(self):
+        for pid in self.pids:
+            os.kill(pid, signal.SIGTERM)
+        for pid in self.pids:
+            os.waitpid(pid, 0)
+        self.listener.close()
+
+    def send(self, scenario, request):
+        # the test settings allow the 'testserver' host whatever ALLOWED_HOSTS says
+        headers = {'Host': 'testserver'}
+        if scenario.role in self.dataset.auth:
+            headers['Authorization'] = self.dataset.auth[scenario.role]
+        if request.content_type:
+            headers['Content-Type'] = request.content_type
+        http_connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=120)
+        try:
+            start = time.perf_counter()
+            http_connection.request(request.method, request.path, body=request.body, headers=headers)
+            response = http_connection.getresponse()
+            response.read()
+            return response.status, time.perf_counter() - start
+        finally:
+            http_connection.close()
+
+    def run(self, scenario, iterations):
+        self.send(scenario, scenario.prepare(self.dataset, 0))
+        if scenario.serial:
+            # each request needs the state its prepare left, they go one after the other
+            outcomes = [self.send(scenario, scenario.prepare(self.dataset, i)) for i in range(1, iterations + 1)]
+            elapsed = sum(latency for _, latency in outcomes)
+        else:
+            # prepared up front, the database work of prepare stays out of the concurrent phase
+            requests = [scenario.prepare(self.dataset, i) for i in range(1, iterations + 1)]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(self.workers) as pool:
+                outcomes = list(pool.map(lambda request: self.send(scenario, request), requests))
+            elapsed = time.perf_counter() - start
+        return {
+            **_summary([latency for _, latency in outcomes]), 'requests_per_second': round(len(outcomes) / elapsed, 1),
+            'status': sorted({status for status, _ in outcomes}),
+        }
+
+def run(driver, scenarios, iterations, progress=None):
+    results = {}
+    for scenario in scenarios:
+        results[scenario.name] = driver.run(scenario, iterations)
+        if progress is not None:
+            progress(scenario.name, results[scenario.name])
+    return results